@@ -1,6 +1,10 @@
+from .binary import BinaryWriter
+from .cache import PlanCache
 from .device import Device
 from .drawing import Drawing
+from .farm import Farm
 from .lindenmayer import LSystem
+from .monitor import Monitor
 from .paths import (
     convex_hull,
     crop_path,
@@ -16,7 +20,10 @@ from .paths import (
     simplify_paths,
     sort_paths,
 )
+from .pathset import PathSet
 from .planner import Planner
+from .server import Client, Server
+from .simulator import Simulator
 from .turtle import Turtle
 from .util import draw, reset
 
@@ -0,0 +1,131 @@
+from __future__ import division
+
+import mmap
+import struct
+
+import numpy as np
+
+from .pathset import PathSet
+
+# a binary drawing (.axb) is a 32 byte header followed by three little
+# endian arrays, each starting on an 8 byte boundary:
+#
+#   magic 'AXIB', uint16 version, uint16 flags, uint64 paths, uint64 points
+#   coords   float64 or float32 (flag 1), points x 2
+#   offsets  int64, paths + 1, path i is coords[offsets[i]:offsets[i + 1]]
+#   layers   int32, paths, only if flag 2 is set
+#
+# coords come first so that paths can be streamed to a file before their
+# number is known; the header is written last
+MAGIC = b'AXIB'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQQ8x')
+
+FLOAT32 = 1
+LAYERS = 2
+
+DTYPES = {'f8': '<f8', 'f4': '<f4'}
+
+def is_binary(filename):
+    with open(filename, 'rb') as fp:
+        return fp.read(len(MAGIC)) == MAGIC
+
+# a binary writer streams paths to a file, holding only their offsets and
+# layers in memory. use it as a context manager, or call close
+class BinaryWriter(object):
+    def __init__(self, filename, dtype='f8', layers=False):
+        if dtype not in DTYPES:
+            raise Exception('unknown coordinate type: %r' % dtype)
+        self.dtype = DTYPES[dtype]
+        self.flags = (FLOAT32 if dtype == 'f4' else 0) | (
+            LAYERS if layers else 0)
+        self.fp = open(filename, 'wb')
+        self.fp.write(HEADER.pack(MAGIC, VERSION, self.flags, 0, 0))
+        self.offsets = np.zeros(1024, dtype='<i8')
+        self.layers = np.zeros(1024, dtype='<i4')
+        self.m = 0 # paths written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, path, layer=0):
+        coords = np.asarray(path, dtype=self.dtype).reshape(-1, 2)
+        self.fp.write(coords.tobytes())
+        self.add([self.offsets[self.m] + len(coords)], [layer])
+
+    def write_paths(self, paths, layers=None):
+        # many paths at once; a PathSet is written in one piece
+        if not isinstance(paths, PathSet):
+            for i, path in enumerate(paths):
+                self.write(path, 0 if layers is None else layers[i])
+            return
+        self.fp.write(paths.coords.astype(self.dtype).tobytes())
+        if layers is None:
+            layers = np.zeros(len(paths))
+        self.add(paths.offsets[1:] + self.offsets[self.m], layers)
+
+    def add(self, ends, layers):
+        m = self.m + len(ends)
+        if m + 1 > len(self.offsets):
+            size = max(m + 1, 2 * len(self.offsets))
+            self.offsets = np.resize(self.offsets, size)
+            self.layers = np.resize(self.layers, size)
+        self.offsets[self.m + 1:m + 1] = ends
+        self.layers[self.m:m] = layers
+        self.m = m
+
+    def close(self):
+        if self.fp is None:
+            return
+        self.fp.write(self.offsets[:self.m + 1].tobytes())
+        if self.flags & LAYERS:
+            self.fp.write(self.layers[:self.m].tobytes())
+        self.fp.seek(0)
+        self.fp.write(HEADER.pack(MAGIC, VERSION, self.flags,
+            self.m, int(self.offsets[self.m])))
+        self.fp.close()
+        self.fp = None
+
+def dump_binary(paths, filename, dtype='f8', layers=None):
+    with BinaryWriter(filename, dtype, layers is not None) as writer:
+        writer.write_paths(paths, layers)
+
+def load_binary(filename, use_mmap=True):
+    # (PathSet, layers or None). with use_mmap, float64 coords, the offsets
+    # and the layers are read only views of the mapped file
+    with open(filename, 'rb') as fp:
+        if use_mmap:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            data = fp.read()
+    if len(data) < HEADER.size:
+        raise Exception('%s: not a binary drawing' % filename)
+    magic, version, flags, m, n = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise Exception('%s: not a binary drawing' % filename)
+    if version > VERSION:
+        raise Exception('%s: unsupported version %d' % (filename, version))
+    dtype = '<f4' if flags & FLOAT32 else '<f8'
+    offset = HEADER.size
+    coords = np.frombuffer(data, dtype, n * 2, offset).reshape(-1, 2)
+    offset += coords.nbytes
+    offsets = np.frombuffer(data, '<i8', m + 1, offset)
+    offset += offsets.nbytes
+    layers = None
+    if flags & LAYERS:
+        layers = np.frombuffer(data, '<i4', m, offset)
+    return PathSet(coords, offsets), layers
+
+def select_layer(paths, layers, layer):
+    # the paths with a layer id, as a new PathSet
+    offsets = paths.offsets
+    keep = np.flatnonzero(layers == layer)
+    counts = offsets[keep + 1] - offsets[keep]
+    new_offsets = np.zeros(len(keep) + 1, dtype=np.int64)
+    np.cumsum(counts, out=new_offsets[1:])
+    index = np.repeat(offsets[keep] - new_offsets[:-1], counts)
+    index += np.arange(new_offsets[-1])
+    return PathSet(paths.coords[index], new_offsets)
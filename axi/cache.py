@@ -0,0 +1,119 @@
+from __future__ import division, print_function
+
+import hashlib
+import os
+import tempfile
+
+from collections import OrderedDict
+
+import numpy as np
+
+from .planner import CompactPlan
+
+# os.replace overwrites on every platform, but is missing in python 2
+replace = getattr(os, 'replace', os.rename)
+
+# total size of the files kept by a plan cache, in bytes
+PLAN_CACHE_SIZE = 256 * 1024 * 1024
+
+# bump this when planner output changes, so that old entries are not used
+PLAN_CACHE_VERSION = 1
+
+# a plan cache keeps compact plans on disk as raw little endian float64 block
+# arrays, in files named by a hash of the path coordinates and every planner
+# setting that affects the plan. when the files grow past max_bytes, the
+# least recently used ones are deleted. several processes can share a
+# directory; a missing or unreadable file is just a miss
+class PlanCache(object):
+    def __init__(self, path, max_bytes=PLAN_CACHE_SIZE):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        # file sizes by key, least recently used first
+        self.files = OrderedDict()
+        self.size = 0
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.plan'):
+                continue
+            stat = os.stat(os.path.join(self.path, name))
+            entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self.files[key] = size
+            self.size += size
+        self.evict()
+
+    def key(self, planner, points):
+        settings = (PLAN_CACHE_VERSION, planner.acceleration,
+            planner.max_velocity, planner.corner_factor, planner.engine,
+            planner.velocity_pass, planner.throttle_dt,
+            planner.throttle_threshold)
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        h = hashlib.sha1(repr(settings).encode('utf-8'))
+        h.update(np.ascontiguousarray(points).tobytes())
+        return h.hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.path, key + '.plan')
+
+    def get(self, key):
+        filename = self.filename(key)
+        try:
+            with open(filename, 'rb') as fp:
+                data = np.frombuffer(fp.read(), dtype='<f8')
+            plan = CompactPlan(*data.reshape(len(CompactPlan.ARRAYS), -1))
+            os.utime(filename, None)
+        except Exception:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if key in self.files:
+            self.files[key] = self.files.pop(key)
+        else:
+            # written by another process
+            self.add(key, os.path.getsize(filename))
+        return plan
+
+    def put(self, key, plan):
+        # write to a temporary file and rename it, so readers never see a
+        # partial file
+        fd, temp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        arrays = np.array(plan.compact().arrays(), dtype='<f8')
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(arrays.tobytes())
+        filename = self.filename(key)
+        replace(temp, filename)
+        self.add(key, os.path.getsize(filename))
+
+    def add(self, key, size):
+        # count a file as the most recently used
+        self.size += size - self.files.pop(key, 0)
+        self.files[key] = size
+        self.evict()
+
+    def evict(self):
+        while self.size > self.max_bytes and self.files:
+            key, size = self.files.popitem(last=False)
+            self.size -= size
+            try:
+                os.remove(self.filename(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        for key in list(self.files):
+            try:
+                os.remove(self.filename(key))
+            except OSError:
+                pass
+        self.files.clear()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def print_stats(self):
+        print('plan cache      : %d hits, %d misses, %d plans, %.1f MB' % (
+            self.hits, self.misses, len(self.files), self.size / 1e6))
@@ -0,0 +1,129 @@
+from __future__ import division
+
+from math import modf
+
+import numpy as np
+
+# a compiler converts motion plans into stepper moves ahead of time, so that
+# sending them to the device doesn't involve any computation. each move is a
+# row of (duration_ms, steps_x, steps_y)
+
+# longest move that coalescing will produce
+COALESCE_MAX_MS = 1000
+
+def compile_plan(plan, steps_per_unit, step_ms, error=(0, 0),
+        coalesce=False, max_ms=COALESCE_MAX_MS):
+    # one move per timeslice of step_ms. fractional steps are carried from
+    # one move to the next, and the final carry is returned with the moves
+    plan = plan.compact()
+    times = plan.times(step_ms / 1000)
+    samples = plan.sample(times)
+    x, y = samples.x, samples.y
+    dx = (np.diff(x) * steps_per_unit).tolist()
+    dy = (np.diff(y) * steps_per_unit).tolist()
+    ex, ey = error
+    sxs = []
+    sys = []
+    for ddx, ddy in zip(dx, dy):
+        ex, sx = modf(ddx + ex)
+        ey, sy = modf(ddy + ey)
+        sxs.append(sx)
+        sys.append(sy)
+    moves = np.zeros((len(sxs), 3), dtype=np.int64)
+    moves[:, 0] = step_ms
+    moves[:, 1] = sxs
+    moves[:, 2] = sys
+    if coalesce:
+        moves = coalesce_moves(plan, times, moves, step_ms, max_ms)
+    return moves, (ex, ey)
+
+def coalesce_moves(plan, times, moves, step_ms, max_ms):
+    # merge consecutive timeslices into longer moves when they have the same
+    # step rate, or when they fall within the same constant velocity block.
+    # the total number of steps is unchanged, so the error carry still holds
+    if len(moves) < 2:
+        return moves
+    i = np.searchsorted(plan.ts, np.clip(times, 0, plan.t), 'right') - 1
+    i = np.clip(i, 0, len(plan) - 1)
+    cruise = (i[:-1] == i[1:]) & (plan.a[i[:-1]] == 0)
+    same = (moves[1:] == moves[:-1]).all(axis=1)
+    join = np.zeros(len(moves), dtype=bool)
+    join[1:] = same | (cruise[1:] & cruise[:-1] & (i[1:-1] == i[:-2]))
+    # split runs so that no merged move is longer than max_ms
+    run = np.cumsum(~join)
+    first = np.flatnonzero(~join)
+    index = np.arange(len(moves)) - first[run - 1]
+    join &= index % max(1, max_ms // step_ms) != 0
+    starts = np.flatnonzero(~join)
+    return np.add.reduceat(moves, starts)
+
+def compile_plans(plans, steps_per_unit, step_ms, error=(0, 0),
+        coalesce=False, max_ms=COALESCE_MAX_MS):
+    # compile plans that run one after another, carrying the error between
+    # them. returns a list of (moves, error) with the error after each plan
+    result = []
+    for plan in plans:
+        moves, error = compile_plan(
+            plan, steps_per_unit, step_ms, error, coalesce, max_ms)
+        result.append((moves, error))
+    return result
+
+# the EBB's low level move (LM) command takes step rates in steps per 25 kHz
+# interrupt tick, scaled by 2^31. accelerations are added to the rate on
+# every tick
+LM_TICK_HZ = 25000
+LM_RATE_SCALE = 2 ** 31 / LM_TICK_HZ
+LM_ACCEL_SCALE = 2 ** 31 / LM_TICK_HZ ** 2
+LM_MAX_RATE = 2 ** 31 - 1
+
+def compile_plan_lm(plan, steps_per_unit, error=(0, 0)):
+    # one low level move per block, letting the firmware do the
+    # acceleration. each row is (duration_us, rate1, steps1, accel1, rate2,
+    # steps2, accel2), where 1 and 2 are the motors (x + y and x - y)
+    plan = plan.compact()
+    dx = ((plan.x2 - plan.x1) * steps_per_unit).tolist()
+    dy = ((plan.y2 - plan.y1) * steps_per_unit).tolist()
+    ex, ey = error
+    sxs = []
+    sys = []
+    for ddx, ddy in zip(dx, dy):
+        ex, sx = modf(ddx + ex)
+        ey, sy = modf(ddy + ey)
+        sxs.append(sx)
+        sys.append(sy)
+    sx = np.array(sxs)
+    sy = np.array(sys)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ux = np.where(plan.ds > 0, (plan.x2 - plan.x1) / plan.ds, 0)
+        uy = np.where(plan.ds > 0, (plan.y2 - plan.y1) / plan.ds, 0)
+    t = plan.dt
+    v = plan.vi * steps_per_unit
+    m1 = sx + sy
+    m2 = sx - sy
+    rate1, accel1 = motor_profile(np.abs(m1), v * np.abs(ux + uy), t)
+    rate2, accel2 = motor_profile(np.abs(m2), v * np.abs(ux - uy), t)
+    moves = np.column_stack([np.round(t * 1e6), rate1, m1, accel1,
+        rate2, m2, accel2]).astype(np.int64)
+    # blocks too short to move either motor are dropped
+    moves = moves[(m1 != 0) | (m2 != 0)]
+    return moves, (ex, ey)
+
+def motor_profile(steps, rate, t):
+    # initial rate and acceleration that cover the steps in time t, so both
+    # motors finish together despite rounding. the final rate is kept
+    # non-negative, and decelerating profiles aim slightly past the last
+    # step, so the firmware's discrete ticks and the rounding of accel can't
+    # stall a motor that slows to a stop just short of its last step
+    ticks = t * LM_TICK_HZ
+    margin = rate / LM_TICK_HZ + ticks * ticks / 4 / 2 ** 31
+    final = 2 * steps / t - rate
+    target = np.where(final < rate, steps + margin, steps)
+    final = 2 * target / t - rate
+    rate = np.where(final < 0, 2 * target / t, rate)
+    final = np.maximum(final, 0)
+    accel = (final - rate) / t
+    rate = np.where(steps > 0, rate, 0)
+    accel = np.where(steps > 0, accel, 0)
+    rate = np.clip(np.round(rate * LM_RATE_SCALE), 0, LM_MAX_RATE)
+    accel = np.round(accel * LM_ACCEL_SCALE)
+    return rate, accel
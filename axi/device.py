@@ -1,12 +1,16 @@
 from __future__ import division, print_function
 
+import re
 import time
 
-from math import modf
+from collections import namedtuple
+
 from serial import Serial
 from serial.tools.list_ports import comports
 
+from .compiler import compile_plan, compile_plan_lm
 from .paths import path_length
+from .pipeline import Pipeline, Prefetch
 from .planner import Planner
 from .progress import Bar
 
@@ -33,13 +37,44 @@ CORNER_FACTOR = 0.001
 JOG_ACCELERATION = 16
 JOG_MAX_VELOCITY = 8
 
+# merge timeslices with the same step rate into longer moves
+COALESCE = True
+
+# XM: sample the plan into timeslices on the host
+# LM: send one low level move per block and let the firmware accelerate
+MOVE_COMMANDS = ('XM', 'LM')
+MOVE_COMMAND = 'XM'
+
+# oldest EBB firmware that understands LM
+LM_FIRMWARE = (2, 7, 0)
+
+# number of commands to keep in flight without waiting for a response, or
+# zero to wait for each response before sending the next command
+PIPELINE_WINDOW = 0
+
+# commands whose response is more than one line
+RESPONSE_LINES = {'QP': 2, 'QS': 2}
+
+# commands whose response the caller needs, so they are never pipelined
+QUERY_COMMANDS = ('QS', 'QM', 'QP', 'QB', 'QC', 'QE', 'QG', 'QL', 'QR', 'V')
+
+# number of paths to plan and compile on a background thread while earlier
+# ones are being sent, or zero to plan each path just before sending it
+PLAN_AHEAD = 0
+
 VID_PID = '04D8:FD92'
 
+# seconds spent drawing, jogging (including the final jog home) and moving
+# the pen servo
+Estimate = namedtuple('Estimate', ['draw', 'jog', 'pen', 'total'])
+
+def find_ports():
+    # every connected axidraw, in the order the system lists them
+    return [port[0] for port in comports() if VID_PID in port[2]]
+
 def find_port():
-    for port in comports():
-        if VID_PID in port[2]:
-            return port[0]
-    return None
+    ports = find_ports()
+    return ports[0] if ports else None
 
 class Device(object):
     def __init__(self, **kwargs):
@@ -55,16 +90,39 @@ class Device(object):
         self.corner_factor = CORNER_FACTOR
         self.jog_acceleration = JOG_ACCELERATION
         self.jog_max_velocity = JOG_MAX_VELOCITY
+        self.coalesce = COALESCE
+        self.move_command = MOVE_COMMAND
+        self.pipeline_window = PIPELINE_WINDOW
+        self.plan_ahead = PLAN_AHEAD
+        self.plan_cache = None # e.g. PlanCache('~/.axi/plans')
+        self.monitor = None # e.g. Monitor(), reported by run_drawing
+        self.port = None # found with find_port by default
+        self.serial = None # any object with write and readline
+        self.connect = True # False for planning and estimates only
 
         for k, v in kwargs.items():
             setattr(self, k, v)
 
-        self.error = (0, 0) # accumulated step error
+        if self.move_command not in MOVE_COMMANDS:
+            raise Exception('unknown move command: %r' % self.move_command)
 
-        port = find_port()
-        if port is None:
-            raise Exception('cannot find axidraw device')
-        self.serial = Serial(port, timeout=1)
+        self.error = (0, 0) # accumulated step error
+        self.steps = None # host side step position, or None until resync
+        self.reset_move_counts()
+
+        self.pipeline = None
+        if not self.connect:
+            return
+        if self.serial is None:
+            if self.port is None:
+                self.port = find_port()
+            if self.port is None:
+                raise Exception('cannot find axidraw device')
+            self.serial = Serial(self.port, timeout=1)
+        if self.pipeline_window:
+            self.pipeline = Pipeline(self.serial, self.pipeline_window)
+        if self.move_command == 'LM':
+            self.check_firmware(LM_FIRMWARE)
         self.configure()
 
     def configure(self):
@@ -82,7 +140,15 @@ class Device(object):
         self.command('SC', 12, int(self.pen_down_speed * 5))
 
     def close(self):
-        self.serial.close()
+        if self.pipeline:
+            self.pipeline.close()
+        if self.serial is not None:
+            self.serial.close()
+
+    def flush(self):
+        # wait for every pipelined command to be acknowledged
+        if self.pipeline:
+            self.pipeline.flush()
 
     def make_planner(self, jog=False):
         a = self.acceleration
@@ -91,15 +157,30 @@ class Device(object):
         if jog:
             a = self.jog_acceleration
             vmax = self.jog_max_velocity
-        return Planner(a, vmax, cf)
+        return Planner(a, vmax, cf, cache=self.plan_cache)
 
     def readline(self):
         return self.serial.readline().decode('utf-8').strip()
 
     def command(self, *args):
         line = ','.join(map(str, args))
+        lines = RESPONSE_LINES.get(args[0], 1)
+        if self.pipeline:
+            response = self.pipeline.submit(line, lines)
+            if self.monitor is not None:
+                self.monitor.add(args, response)
+            if args[0] in QUERY_COMMANDS:
+                self.pipeline.wait(response)
+                return response.result()
+            return None
+        sent = time.time()
         self.serial.write((line + '\r').encode('utf-8'))
-        return self.readline()
+        response = self.readline()
+        for _ in range(lines - 1):
+            self.readline()
+        if self.monitor is not None:
+            self.monitor.record(args, sent, time.time())
+        return response
 
     # higher level functions
     def move(self, dx, dy):
@@ -107,7 +188,7 @@ class Device(object):
 
     def goto(self, x, y, jog=True):
         # TODO: jog if pen up
-        px, py = self.read_position()
+        px, py = self.position
         self.run_path([(px, py), (x, y)], jog)
 
     def home(self):
@@ -117,6 +198,23 @@ class Device(object):
     def version(self):
         return self.command('V')
 
+    def firmware_version(self):
+        # (major, minor, patch), or None if the response has no version
+        match = re.search(r'(\d+)\.(\d+)\.(\d+)', self.version())
+        if match is None:
+            return None
+        return tuple(int(x) for x in match.groups())
+
+    def check_firmware(self, required):
+        # older firmware answers unknown commands with an error that is not
+        # checked outside of a pipeline, so the moves would be lost
+        firmware = self.firmware_version()
+        if firmware is None or firmware < required:
+            self.close()
+            raise Exception('%s needs EBB firmware %s or newer, found %s' % (
+                self.move_command, '.'.join(map(str, required)),
+                '.'.join(map(str, firmware)) if firmware else 'unknown'))
+
     # motor functions
     def enable_motors(self):
         m = MICROSTEPPING_MODE
@@ -129,41 +227,110 @@ class Device(object):
         return self.command('QM')
 
     def zero_position(self):
-        return self.command('CS')
+        response = self.command('CS')
+        self.steps = (0, 0)
+        self.error = (0, 0)
+        return response
 
-    def read_position(self):
+    def read_steps(self):
+        # x and y steps from the board's motor step counters
         response = self.command('QS')
-        self.readline()
         a, b = map(int, response.split(','))
-        a /= self.steps_per_unit
-        b /= self.steps_per_unit
-        y = (a - b) / 2
-        x = y + b
-        return x, y
+        return (a + b) // 2, (a - b) // 2
+
+    def read_position(self):
+        x, y = self.read_steps()
+        return x / self.steps_per_unit, y / self.steps_per_unit
+
+    @property
+    def position(self):
+        # where the moves sent so far end, from the host side step position
+        # and the fractional step error still carried. only queries the board
+        # if the position is not known yet
+        if self.steps is None:
+            self.resync()
+        x, y = self.steps
+        ex, ey = self.error
+        return (x + ex) / self.steps_per_unit, (y + ey) / self.steps_per_unit
+
+    def verify_position(self):
+        # True if the board's step counters agree with the host side position
+        self.wait()
+        return self.steps is None or self.read_steps() == self.steps
+
+    def resync(self):
+        # adopt the board's step counters as the host side position
+        self.wait()
+        self.steps = self.read_steps()
+        self.error = (0, 0)
 
     def stepper_move(self, duration, a, b):
         return self.command('XM', duration, a, b)
 
+    def low_level_move(self, rate1, steps1, accel1, rate2, steps2, accel2):
+        return self.command(
+            'LM', rate1, steps1, accel1, rate2, steps2, accel2)
+
     def wait(self):
         while '1' in self.motor_status():
             time.sleep(0.01)
 
+    def compile_moves(self, plan, error):
+        # convert a plan into rows for run_moves, with the final step error
+        if self.move_command == 'LM':
+            return compile_plan_lm(plan, self.steps_per_unit, error)
+        return compile_plan(plan, self.steps_per_unit, TIMESLICE_MS, error,
+            self.coalesce)
+
     def run_plan(self, plan):
-        step_ms = TIMESLICE_MS
-        step_s = step_ms / 1000
-        t = 0
-        while t < plan.t:
-            i1 = plan.instant(t)
-            i2 = plan.instant(t + step_s)
-            d = i2.p.sub(i1.p)
-            ex, ey = self.error
-            ex, sx = modf(d.x * self.steps_per_unit + ex)
-            ey, sy = modf(d.y * self.steps_per_unit + ey)
-            self.error = ex, ey
-            self.stepper_move(step_ms, int(sx), int(sy))
-            t += step_s
+        moves, self.error = self.compile_moves(plan, self.error)
+        self.run_moves(moves)
         # self.wait()
 
+    def run_moves(self, moves):
+        self.move_count += len(moves)
+        self.move_time += self.moves_time(moves)
+        self.update_steps(moves)
+        if self.move_command == 'LM':
+            for row in moves.tolist():
+                self.low_level_move(*row[1:])
+        else:
+            for duration, a, b in moves.tolist():
+                self.stepper_move(duration, a, b)
+
+    def update_steps(self, moves):
+        # advance the host side step position by rows from compile_moves
+        if self.steps is None or not len(moves):
+            return
+        x, y = self.steps
+        if self.move_command == 'LM':
+            m1 = int(moves[:, 2].sum())
+            m2 = int(moves[:, 5].sum())
+            self.steps = (x + (m1 + m2) // 2, y + (m1 - m2) // 2)
+        else:
+            a = int(moves[:, 1].sum())
+            b = int(moves[:, 2].sum())
+            self.steps = (x + a, y + b)
+
+    def moves_time(self, moves):
+        # seconds of motion in rows from compile_moves
+        if not len(moves):
+            return 0
+        if self.move_command == 'LM':
+            return moves[:, 0].sum() / 1e6
+        return moves[:, 0].sum() / 1e3
+
+    def reset_move_counts(self):
+        self.move_count = 0 # stepper moves sent
+        self.move_time = 0 # seconds of motion they cover
+
+    def print_move_counts(self):
+        slices = int(round(self.move_time * 1000 / TIMESLICE_MS))
+        saved = slices - self.move_count
+        percent = 100 * saved / slices if slices else 0
+        print('stepper moves   : %d %s (%d timeslices, %.1f%% fewer)' % (
+            self.move_count, self.move_command, slices, percent))
+
     def run_path(self, path, jog=False):
         planner = self.make_planner(jog)
         plan = planner.plan(path)
@@ -175,37 +342,165 @@ class Device(object):
         print('pen up length   : %g' % drawing.up_length)
         print('total length    : %g' % drawing.length)
         print('drawing bounds  : %s' % str(drawing.bounds))
+        self.reset_move_counts()
+        paths = drawing.all_paths
+        compiled = self.compile_paths(paths, self.error)
+        if self.plan_ahead:
+            compiled = Prefetch(compiled, self.plan_ahead)
+        try:
+            self.pen_up()
+            bar = PlotProgress(self, paths, progress)
+            for i, (moves, error) in enumerate(compiled):
+                if self.monitor is not None:
+                    self.mark_path(i, moves)
+                self.run_compiled_path(i, moves, error)
+                bar.update(i, moves)
+            self.flush()
+        finally:
+            if self.plan_ahead:
+                compiled.close()
+        bar.done()
+        self.print_move_counts()
+        if self.monitor is not None:
+            self.monitor.report()
+        if self.plan_ahead:
+            compiled.print_stats()
+        if self.plan_cache is not None:
+            self.plan_cache.print_stats()
+
+    def plan_drawing(self, drawing, processes=1):
+        planner = self.make_planner()
+        plans = planner.plan_all(drawing.all_paths, processes)
+        return [plan.compact() for plan in plans]
+
+    def plan_paths(self, paths, processes=1):
+        # plans for alternating jogs and paths, starting with a jog. jogs
+        # are cheap, so only the paths are spread over processes
+        plans = [None] * len(paths)
+        plans[::2] = self.make_planner(jog=True).plan_all(paths[::2])
+        plans[1::2] = self.make_planner().plan_all(paths[1::2], processes)
+        return plans
+
+    def compile_paths(self, paths, error):
+        # plan and compile alternating jogs and paths, starting with a jog,
+        # yielding (moves, error) for each
+        jog_planner = self.make_planner(jog=True)
+        planner = self.make_planner()
+        for i, path in enumerate(paths):
+            plan = (planner if i % 2 else jog_planner).plan(path)
+            moves, error = self.compile_moves(plan, error)
+            yield moves, error
+
+    def compile_drawing(self, drawing, processes=1):
+        # plan and compile every jog and path ahead of time. the result is a
+        # list of (moves, error) in drawing.all_paths order, for run_compiled
+        result = []
+        error = self.error
+        for plan in self.plan_paths(drawing.all_paths, processes):
+            moves, error = self.compile_moves(plan, error)
+            result.append((moves, error))
+        return result
+
+    def run_compiled(self, compiled):
+        # send the output of compile_drawing
         self.pen_up()
-        position = (0, 0)
-        bar = Bar(drawing.length, enabled=progress)
-        for path in drawing.paths:
-            jog = [position, path[0]]
-            self.run_path(jog, jog=True)
-            bar.increment(path_length(jog))
+        for i, (moves, error) in enumerate(compiled):
+            self.run_compiled_path(i, moves, error)
+        self.flush()
+
+    def mark_path(self, i, moves):
+        # tell the monitor that entry i of drawing.all_paths starts here
+        planned = self.moves_time(moves)
+        if i % 2:
+            planned += (self.pen_up_duration() +
+                self.pen_down_duration()) / 1000
+            self.monitor.mark('path %d' % (i // 2), planned)
+        else:
+            self.monitor.mark('jog %d' % (i // 2), planned)
+
+    def run_compiled_path(self, i, moves, error):
+        # odd entries are pen down paths, even entries are jogs
+        if i % 2:
             self.pen_down()
-            self.run_path(path)
+        self.run_moves(moves)
+        self.error = error
+        if i % 2:
             self.pen_up()
-            position = path[-1]
-            bar.increment(path_length(path))
-        bar.done()
-        self.run_path([position, (0, 0)], jog=True)
 
-    def plan_drawing(self, drawing):
-        result = []
+    def estimate_time(self, drawing, exact=False):
+        # plot time with this device's settings. the default analytic mode
+        # sums each segment's duration from the planner's velocities without
+        # building blocks; exact plans every path and sums the plan times
+        jog_planner = self.make_planner(jog=True)
         planner = self.make_planner()
-        for path in drawing.all_paths:
-            result.append(planner.plan(path))
-        return result
+        times = [0, 0]
+        for i, path in enumerate(drawing.all_paths):
+            p = planner if i % 2 else jog_planner
+            times[i % 2] += p.plan(path).t if exact else p.plan_time(path)
+        n = len(drawing.paths)
+        pen = (self.pen_up_duration() * (n + 1) +
+            self.pen_down_duration() * n) / 1000
+        jog, draw = times
+        return Estimate(draw, jog, pen, draw + jog + pen)
 
     # pen functions
-    def pen_up(self):
+    def pen_up_duration(self):
+        # milliseconds the firmware waits after raising the pen
         delta = abs(self.pen_up_position - self.pen_down_position)
         duration = int(1000 * delta / self.pen_up_speed)
-        delay = max(0, duration + self.pen_up_delay)
-        return self.command('SP', 1, delay)
+        return max(0, duration + self.pen_up_delay)
 
-    def pen_down(self):
+    def pen_down_duration(self):
         delta = abs(self.pen_up_position - self.pen_down_position)
         duration = int(1000 * delta / self.pen_down_speed)
-        delay = max(0, duration + self.pen_down_delay)
-        return self.command('SP', 0, delay)
+        return max(0, duration + self.pen_down_delay)
+
+    def pen_up(self):
+        return self.command('SP', 1, self.pen_up_duration())
+
+    def pen_down(self):
+        return self.command('SP', 0, self.pen_down_duration())
+
+# progress of run_drawing in seconds of planned motion and pen moves sent.
+# jogs are straight moves with a closed form duration and pen moves have a
+# fixed one, so only the time of the pen down paths still to come has to be
+# predicted, from their length at the seconds per unit length planned so
+# far. the total becomes exact as the drawing completes, without planning
+# everything up front
+class PlotProgress(object):
+    def __init__(self, device, paths, enabled=True):
+        planner = device.make_planner(jog=True)
+        self.jog_time = sum(planner.plan_time(path) for path in paths[0::2])
+        self.pen = (device.pen_up_duration() +
+            device.pen_down_duration()) / 1000 # per pen down path
+        self.pen_time = self.pen * (len(paths) // 2)
+        self.lengths = [path_length(path) for path in paths]
+        self.remaining = sum(self.lengths[1::2]) # pen down length to send
+        self.planned = 0 # pen down seconds sent
+        self.travelled = 0 # pen down length sent
+        self.rate = 1 / device.max_velocity # until a path has been sent
+        self.sent = 0
+        self.device = device
+        self.bar = Bar(self.predicted(), enabled=enabled, timed=True)
+
+    def predicted(self):
+        rate = self.rate
+        if self.travelled:
+            rate = self.planned / self.travelled
+        return (self.jog_time + self.pen_time + self.planned +
+            self.remaining * rate)
+
+    def update(self, i, moves):
+        # call after sending entry i of drawing.all_paths
+        t = self.device.moves_time(moves)
+        self.sent += t
+        if i % 2:
+            self.planned += t
+            self.travelled += self.lengths[i]
+            self.remaining -= self.lengths[i]
+            self.sent += self.pen
+        self.bar.max_value = max(self.predicted(), self.sent)
+        self.bar.update(self.sent)
+
+    def done(self):
+        self.bar.done()
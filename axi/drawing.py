@@ -2,9 +2,15 @@ from __future__ import division
 
 from math import sin, cos, radians, hypot
 
+import numpy as np
+
+from .binary import dump_binary, is_binary, load_binary, select_layer
+from .device import Device
 from .paths import (
     simplify_paths, sort_paths, join_paths, crop_paths, convex_hull,
-    expand_quadratics, paths_length)
+    paths_length)
+from .parser import load_axi, loads_axi
+from .pathset import PATHSET_POINTS, PathSet
 
 try:
     import cairocffi as cairo
@@ -19,7 +25,26 @@ A3_BOUNDS = (0, 0, 16.93, 11.69)
 
 class Drawing(object):
     def __init__(self, paths=None):
-        self.paths = paths or []
+        # a list of paths is kept as it is given. a PathSet comes from
+        # from_arrays, load_binary, or loading a large text drawing
+        if not isinstance(paths, PathSet):
+            paths = paths or []
+        self.paths = paths # a list of paths, or a PathSet
+
+    # translate, scale and rotate don't touch any coordinates. they return a
+    # drawing that shares these paths and holds the composed affine matrix,
+    # which is applied once, vectorized, when the coordinates are needed
+    @property
+    def paths(self):
+        if self._matrix is not None:
+            self._paths = transform_paths(self._paths, self._matrix)
+            self._matrix = None
+        return self._paths
+
+    @paths.setter
+    def paths(self, paths):
+        self._paths = paths
+        self._matrix = None
         self.dirty()
 
     def dirty(self):
@@ -27,25 +52,46 @@ class Drawing(object):
         self._length = None
         self._down_length = None
         self._hull = None
+        self._base_bounds = None # of the paths before the pending matrix
 
     @classmethod
     def loads(cls, data):
-        paths = []
-        for line in data.split('\n'):
-            line = line.strip()
-            if line.startswith('#'):
-                continue
-            path = line.split()
-            path = [tuple(map(float, x.split(','))) for x in path]
-            path = expand_quadratics(path)
-            if path:
-                paths.append(path)
+        return cls.from_pathset(loads_axi(data))
+
+    @classmethod
+    def from_pathset(cls, paths):
+        # small drawings keep to lists of paths
+        if paths.n < PATHSET_POINTS:
+            paths = paths.tolist()
         return cls(paths)
 
+    @classmethod
+    def from_arrays(cls, coords, offsets):
+        # a drawing that uses the arrays of a PathSet without copying them
+        return cls(PathSet(coords, offsets))
+
+    def to_arrays(self):
+        # (coords, offsets) as in PathSet, shared with this drawing if it is
+        # stored in one
+        paths = PathSet.from_paths(self.paths)
+        return paths.coords, paths.offsets
+
     @classmethod
     def load(cls, filename):
-        with open(filename, 'r') as fp:
-            return cls.loads(fp.read())
+        # text .axi or binary .axb, by content
+        if is_binary(filename):
+            return cls.load_binary(filename)
+        return cls.from_pathset(load_axi(filename))
+
+    @classmethod
+    def load_binary(cls, filename, layer=None):
+        # float64 files are mapped into memory rather than read
+        paths, layers = load_binary(filename)
+        if layer is not None:
+            if layers is None:
+                raise Exception('%s has no layers' % filename)
+            paths = select_layer(paths, layers, layer)
+        return cls(paths)
 
     def dumps(self):
         lines = []
@@ -54,9 +100,16 @@ class Drawing(object):
         return '\n'.join(lines)
 
     def dump(self, filename):
+        # binary if the filename ends with .axb, otherwise text
+        if filename.lower().endswith('.axb'):
+            return self.dump_binary(filename)
         with open(filename, 'w') as fp:
             fp.write(self.dumps())
 
+    def dump_binary(self, filename, dtype='f8', layers=None):
+        # dtype is 'f8' or 'f4'. layers has an int id for each path
+        dump_binary(self.paths, filename, dtype, layers)
+
     def dumps_svg(self, scale=96):
         lines = []
         w = (self.width + 2) * scale
@@ -81,6 +134,8 @@ class Drawing(object):
 
     @property
     def points(self):
+        if isinstance(self.paths, PathSet):
+            return [tuple(p) for p in self.paths.coords.tolist()]
         return [(x, y) for path in self.paths for x, y in path]
 
     @property
@@ -91,6 +146,10 @@ class Drawing(object):
 
     @property
     def bounds(self):
+        if self._bounds is None and self._matrix is not None:
+            self._bounds = self.pending_bounds()
+        if self._bounds is None and isinstance(self.paths, PathSet):
+            self._bounds = self.paths.bounds()
         if self._bounds is None:
             points = self.points
             if points:
@@ -103,8 +162,23 @@ class Drawing(object):
             self._bounds = (x1, y1, x2, y2)
         return self._bounds
 
+    def pending_bounds(self):
+        # bounds without applying the pending matrix, when that is cheap
+        a, b, c, d, e, f = self._matrix
+        if b == 0 and d == 0 and self._base_bounds is not None:
+            x1, y1, x2, y2 = self._base_bounds
+            xs = (a * x1 + c, a * x2 + c)
+            ys = (e * y1 + f, e * y2 + f)
+            return (min(xs), min(ys), max(xs), max(ys))
+        if isinstance(self._paths, PathSet) and len(self._paths):
+            x, y = apply_matrix(self._paths.coords, self._matrix)
+            return (x.min(), y.min(), x.max(), y.max())
+        return None
+
     @property
     def length(self):
+        if self._length is None and isinstance(self.paths, PathSet):
+            self._length = self.down_length + self.paths.jog_length()
         if self._length is None:
             length = self.down_length
             for p0, p1 in zip(self.paths, self.paths[1:]):
@@ -120,6 +194,8 @@ class Drawing(object):
 
     @property
     def down_length(self):
+        if self._down_length is None and isinstance(self.paths, PathSet):
+            self._down_length = self.paths.length()
         if self._down_length is None:
             self._down_length = paths_length(self.paths)
         return self._down_length
@@ -149,11 +225,18 @@ class Drawing(object):
         result.append([position, (0, 0)])
         return result
 
+    def estimate_time(self, device=None, exact=False):
+        # plot time in seconds, using the planner and pen settings of device
+        # or of a default Device. see Device.estimate_time for a breakdown
+        if device is None:
+            device = Device(connect=False)
+        return device.estimate_time(self, exact).total
+
     def simplify_paths(self, tolerance):
         return Drawing(simplify_paths(self.paths, tolerance))
 
     def sort_paths(self, reversable=True):
-        return Drawing(sort_paths(self.paths, reversable))
+        return Drawing(sort_paths(list(self.paths), reversable))
 
     def join_paths(self, tolerance):
         return Drawing(join_paths(self.paths, tolerance))
@@ -165,30 +248,69 @@ class Drawing(object):
     #     return Drawing(util.remove_duplicates(self.paths))
 
     def add(self, drawing):
-        self.paths.extend(drawing.paths)
-        self.dirty()
-
-    def transform(self, func):
-        return Drawing([[func(x, y) for x, y in path] for path in self.paths])
+        # aggregates that are already cached are updated from the other
+        # drawing's, so adding in a loop stays linear
+        paths = self.paths
+        other = drawing.paths
+        if not other:
+            return
+        if not paths:
+            paths.extend(other)
+            self.dirty()
+            return
+        if self._bounds is not None:
+            x1, y1, x2, y2 = self._bounds
+            u1, v1, u2, v2 = drawing.bounds
+            self._bounds = (min(x1, u1), min(y1, v1), max(x2, u2), max(y2, v2))
+        if self._down_length is not None:
+            self._down_length += drawing.down_length
+        if self._length is not None:
+            (x1, y1), (x2, y2) = paths[-1][-1], other[0][0]
+            self._length += hypot(x2 - x1, y2 - y1) + drawing.length
+        if self._hull is not None:
+            points = drawing._hull or drawing.points
+            self._hull = convex_hull(list(self._hull) + list(points))
+        paths.extend(other)
+
+    def transform(self, func, vectorized=False):
+        # func maps x, y to a new point. a vectorized func is called once,
+        # with arrays of every x and y, and returns arrays
+        if not vectorized:
+            return Drawing(
+                [[func(x, y) for x, y in path] for path in self.paths])
+        paths = PathSet.from_paths(self.paths)
+        x, y = func(paths.coords[:, 0], paths.coords[:, 1])
+        coords = np.column_stack([
+            np.broadcast_to(x, len(paths.coords)),
+            np.broadcast_to(y, len(paths.coords))]).astype(np.float64)
+        result = PathSet(coords, paths.offsets)
+        if not isinstance(self.paths, PathSet):
+            result = result.tolist()
+        return Drawing(result)
+
+    def affine(self, a, b, c, d, e, f):
+        # x' = a x + b y + c and y' = d x + e y + f, applied lazily
+        drawing = Drawing()
+        drawing._paths = self._paths[:]
+        drawing._matrix = compose((a, b, c, d, e, f), self._matrix)
+        if self._matrix is None:
+            drawing._base_bounds = self._bounds
+        else:
+            drawing._base_bounds = self._base_bounds
+        return drawing
 
     def translate(self, dx, dy):
-        def func(x, y):
-            return (x + dx, y + dy)
-        return self.transform(func)
+        return self.affine(1, 0, dx, 0, 1, dy)
 
     def scale(self, sx, sy=None):
         if sy is None:
             sy = sx
-        def func(x, y):
-            return (x * sx, y * sy)
-        return self.transform(func)
+        return self.affine(sx, 0, 0, 0, sy, 0)
 
     def rotate(self, angle):
         c = cos(radians(angle))
         s = sin(radians(angle))
-        def func(x, y):
-            return (x * c - y * s, y * c + x * s)
-        return self.transform(func)
+        return self.affine(c, -s, 0, s, c, 0)
 
     def move(self, x, y, ax, ay):
         x1, y1, x2, y2 = self.bounds
@@ -279,3 +401,31 @@ class Drawing(object):
                 dc.line_to(x, y)
         dc.stroke()
         return surface
+
+def compose(m2, m1):
+    # the affine matrix that applies m1 and then m2. either may be None
+    if m1 is None:
+        return tuple(m2)
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (
+        a2 * a1 + b2 * d1, a2 * b1 + b2 * e1, a2 * c1 + b2 * f1 + c2,
+        d2 * a1 + e2 * d1, d2 * b1 + e2 * e1, d2 * c1 + e2 * f1 + f2)
+
+def apply_matrix(coords, matrix):
+    # x and y arrays of (n, 2) coords after an affine matrix
+    a, b, c, d, e, f = matrix
+    x = coords[:, 0]
+    y = coords[:, 1]
+    return x * a + y * b + c, x * d + y * e + f
+
+def transform_paths(paths, matrix):
+    # paths after an affine matrix, stored the same way. converting lists of
+    # tuples to arrays and back costs more than the arithmetic, so lists
+    # are transformed point by point
+    if isinstance(paths, PathSet):
+        coords = np.column_stack(apply_matrix(paths.coords, matrix))
+        return PathSet(coords, paths.offsets)
+    a, b, c, d, e, f = matrix
+    return [[(x * a + y * b + c, x * d + y * e + f) for x, y in path]
+        for path in paths]
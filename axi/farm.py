@@ -0,0 +1,170 @@
+from __future__ import division, print_function
+
+import sys
+import threading
+import time
+
+from .device import Device, PlotProgress, find_ports
+from .progress import REDRAW_INTERVAL, pretty_time
+
+# the outcome of one drawing given to a farm
+class FarmResult(object):
+    def __init__(self, index, estimate):
+        self.index = index # position in the list of drawings
+        self.estimate = estimate # seconds, from Device.estimate_time
+        self.status = 'queued' # plotting, done or failed
+        self.plotter = None # index of the device that plotted it
+        self.attempts = 0
+        self.error = None
+        self.elapsed = None # seconds from first command to flush
+
+# a plotter runs one device of a farm on its own thread. it takes drawings
+# until every drawing is done or failed, or its device fails; a failed
+# plotter stops and the drawing it had is given back to the farm for the
+# others, which wait for work until then
+class Plotter(object):
+    def __init__(self, farm, index, device):
+        self.farm = farm
+        self.index = index
+        self.device = device
+        self.result = None # being plotted
+        self.progress = None # PlotProgress of the current drawing
+        self.done = 0 # drawings plotted
+        self.busy_time = 0
+        self.error = None
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        while True:
+            result = self.farm.take(self)
+            if result is None:
+                break
+            self.result = result
+            start = time.time()
+            try:
+                self.plot(self.farm.drawings[result.index])
+            except Exception as e:
+                self.error = e
+                self.result = None
+                self.farm.failed(self, result, e)
+                break
+            result.elapsed = time.time() - start
+            self.busy_time += result.elapsed
+            self.done += 1
+            self.result = None
+            self.farm.finished(result)
+
+    def plot(self, drawing):
+        device = self.device
+        paths = drawing.all_paths
+        self.progress = PlotProgress(device, paths, enabled=False)
+        device.enable_motors()
+        device.pen_up()
+        compiled = device.compile_paths(paths, device.error)
+        for i, (moves, error) in enumerate(compiled):
+            device.run_compiled_path(i, moves, error)
+            self.progress.update(i, moves)
+        device.flush()
+        device.disable_motors()
+
+    def status(self):
+        if self.error is not None:
+            return 'failed'
+        if self.result is None or self.progress is None:
+            return 'idle'
+        bar = self.progress.bar
+        return '#%d %3.0f%%' % (self.result.index, bar.percent_complete)
+
+# a farm plots a list of drawings (pages, or the layers of one job split into
+# drawings) on several devices at once. each device takes the drawing with
+# the longest estimated plot time that is left, so the devices finish close
+# together however the work is split. by default there is one device for
+# every axidraw found; any devices can be given, such as simulators
+class Farm(object):
+    def __init__(self, devices=None, **kwargs):
+        if devices is None:
+            devices = [Device(port=port, **kwargs) for port in find_ports()]
+        if not devices:
+            raise Exception('cannot find axidraw device')
+        self.plotters = [Plotter(self, i, device)
+            for i, device in enumerate(devices)]
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.drawings = []
+        self.results = []
+        self.queue = []
+
+    def run(self, drawings, progress=True):
+        # plot every drawing and return a FarmResult for each, in order
+        device = self.plotters[0].device
+        self.drawings = list(drawings)
+        self.results = [FarmResult(i, device.estimate_time(d).total)
+            for i, d in enumerate(self.drawings)]
+        self.queue = sorted(self.results, key=lambda x: -x.estimate)
+        for plotter in self.plotters:
+            if plotter.error is None:
+                plotter.start()
+        while any(p.thread and p.thread.is_alive() for p in self.plotters):
+            if progress:
+                self.render()
+            time.sleep(REDRAW_INTERVAL)
+        with self.lock:
+            # left over when every plotter has failed
+            for result in self.queue:
+                result.status = 'failed'
+            self.queue = []
+        if progress:
+            self.render()
+            sys.stdout.write('\n')
+            self.print_stats()
+        return self.results
+
+    def take(self, plotter):
+        # the next drawing, or None once every drawing is done or failed. a
+        # drawing may still come back from a plotter that fails
+        with self.lock:
+            while not self.queue:
+                if all(x.status in ('done', 'failed') for x in self.results):
+                    return None
+                self.changed.wait()
+            result = self.queue.pop(0)
+            result.status = 'plotting'
+            result.plotter = plotter.index
+            result.attempts += 1
+            return result
+
+    def finished(self, result):
+        with self.lock:
+            result.status = 'done'
+            self.changed.notify_all()
+
+    def failed(self, plotter, result, error):
+        with self.lock:
+            result.error = 'plotter %d: %s' % (plotter.index, error)
+            if any(p.error is None for p in self.plotters):
+                # back to the front, for the next free plotter
+                result.status = 'queued'
+                self.queue.insert(0, result)
+            else:
+                result.status = 'failed'
+            self.changed.notify_all()
+
+    def render(self):
+        done = sum(1 for x in self.results if x.status == 'done')
+        items = ['[%d] %s' % (p.index, p.status()) for p in self.plotters]
+        sys.stdout.write('  %s | %d of %d done    \r' % (
+            '  '.join(items), done, len(self.results)))
+        sys.stdout.flush()
+
+    def print_stats(self):
+        for p in self.plotters:
+            line = 'plotter %d      : %d drawings, %s busy' % (
+                p.index, p.done, pretty_time(p.busy_time))
+            if p.error is not None:
+                line += ', failed: %s' % p.error
+            print(line)
@@ -1,6 +1,11 @@
+from __future__ import print_function
+
 import axi
 import sys
 
+from axi.progress import pretty_time
+from axi.server import SOCKET_PATH, Client, Server, server_running
+
 '''
 TODO:
 axi (repl)
@@ -19,30 +24,67 @@ def main():
         im = d.render()
         im.write_to_png(path)
         return
-    device = axi.Device()
-    if command == 'zero':
-        device.zero_position()
-    elif command == 'home':
-        device.home()
-    elif command == 'up':
-        device.pen_up()
-    elif command == 'down':
-        device.pen_down()
-    elif command == 'on':
-        device.enable_motors()
-    elif command == 'off':
-        device.disable_motors()
-    elif command == 'move':
-        dx, dy = map(float, args)
-        device.move(dx, dy)
-    elif command == 'goto':
-        x, y = map(float, args)
-        device.goto(x, y)
-    elif command == 'draw':
+    if command == 'convert':
+        # between text .axi and binary .axb
+        axi.Drawing.load(args[0]).dump(args[1])
+        return
+    if command == 'estimate':
+        d = axi.Drawing.load(args[0])
+        device = axi.Device(connect=False)
+        e = device.estimate_time(d, exact='--exact' in args[1:])
+        print('drawing : %s' % pretty_time(e.draw))
+        print('jogging : %s' % pretty_time(e.jog))
+        print('pen     : %s' % pretty_time(e.pen))
+        print('total   : %s (%.1f seconds)' % (pretty_time(e.total), e.total))
+        return
+    if command == 'serve':
+        path = args[0] if args else SOCKET_PATH
+        server = Server(path=path)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+    if command == 'jobs':
+        for job in Client().jobs():
+            total = pretty_time(job['total']) if job['total'] else '-'
+            print('%4d %-9s %3d %8s %s' % (job['id'], job['status'],
+                job['priority'], total, job['name'] or job['kind']))
+        return
+    if command == 'cancel':
+        client = Client()
+        for id in args:
+            job = client.cancel(int(id))
+            print('%d %s' % (job['id'], job['status']))
+        return
+    if command == 'farm':
+        drawings = [axi.Drawing.load(path) for path in args]
+        for path, result in zip(args, axi.Farm().run(drawings)):
+            if result.status != 'done':
+                print('%s: %s (%s)' % (path, result.status, result.error))
+        return
+    if command == 'draw':
         d = axi.Drawing.load(args[0])
         axi.draw(d)
+        return
+    names = {
+        'zero': 'zero_position',
+        'home': 'home',
+        'up': 'pen_up',
+        'down': 'pen_down',
+        'on': 'enable_motors',
+        'off': 'disable_motors',
+        'move': 'move',
+        'goto': 'goto',
+    }
+    if command not in names:
+        return
+    name = names[command]
+    args = list(map(float, args)) if command in ('move', 'goto') else []
+    if server_running():
+        Client().command(name, *args)
     else:
-        pass
+        getattr(axi.Device(), name)(*args)
 
 if __name__ == '__main__':
     main()
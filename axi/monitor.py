@@ -0,0 +1,160 @@
+from __future__ import division, print_function
+
+import time
+
+from collections import deque
+
+from .simulator import LM_TICK_HZ, lm_ticks
+
+# upper edges of the round trip and send interval histogram buckets, in ms
+HISTOGRAM_MS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+
+# gaps in the modelled motion queue shorter than this are taken to be
+# acknowledgement jitter rather than underruns, in seconds
+UNDERRUN_THRESHOLD = 0.005
+
+# a monitor timestamps every command written to the device and every
+# acknowledgement, and models the board's motion queue from them: a motion
+# command starts once it has been accepted (acknowledged, less the one way
+# latency) and the motion before it has finished. the queue running dry
+# between two motion commands is an underrun. marks split the commands into
+# paths, whose actual duration is measured from acknowledgement times
+class Monitor(object):
+    def __init__(self, threshold=UNDERRUN_THRESHOLD):
+        self.threshold = threshold
+        self.pending = deque() # (args, response) from a pipeline
+        self.start = None
+        self.last_sent = None
+        self.busy_until = None # when queued motion is modelled to finish
+        self.latency = None # smallest round trip seen
+        self.commands = 0
+        self.rtts = []
+        self.intervals = []
+        self.underruns = []
+        self.marks = [] # (label, planned, first ack time)
+        self.motion_time = 0
+
+    def add(self, args, response):
+        # a pipelined command; recorded once its response arrives
+        self.pending.append((args, response))
+        self.update()
+
+    def update(self):
+        while self.pending and self.pending[0][1].event.is_set():
+            args, response = self.pending.popleft()
+            self.record(args, response.sent_time, response.done_time)
+
+    def record(self, args, sent, acked):
+        self.commands += 1
+        if self.start is None:
+            self.start = sent
+        if self.last_sent is not None:
+            self.intervals.append(sent - self.last_sent)
+        self.last_sent = sent
+        rtt = acked - sent
+        self.rtts.append(rtt)
+        if self.latency is None or rtt < self.latency:
+            self.latency = rtt
+        if self.marks and self.marks[-1][2] is None:
+            label, planned, _ = self.marks[-1]
+            self.marks[-1] = (label, planned, acked)
+        duration = motion_duration(args)
+        if duration is None:
+            return
+        self.motion_time += duration
+        accepted = acked - self.latency / 2
+        if self.busy_until is not None:
+            gap = accepted - self.busy_until
+            if gap > self.threshold:
+                self.underruns.append((accepted, gap))
+        self.busy_until = max(accepted, self.busy_until or accepted)
+        self.busy_until += duration
+
+    def queued_time(self, now=None):
+        # seconds of motion modelled as still queued on the board
+        self.update()
+        if self.busy_until is None:
+            return 0
+        now = time.time() if now is None else now
+        return max(0, self.busy_until - now)
+
+    def mark(self, label, planned):
+        # the next command starts a path planned to take this many seconds
+        self.update()
+        self.marks.append((label, planned, None))
+
+    def path_times(self):
+        # (label, planned, actual) for each mark. a path runs from the first
+        # acknowledgement after its mark to the first one after the next
+        self.update()
+        result = []
+        end = self.busy_until
+        for i, (label, planned, t) in enumerate(self.marks):
+            if t is None:
+                continue
+            nt = self.marks[i + 1][2] if i + 1 < len(self.marks) else end
+            if nt is not None:
+                result.append((label, planned, nt - t))
+        return result
+
+    def report(self):
+        self.update()
+        elapsed = (self.last_sent - self.start) if self.commands else 0
+        print('commands        : %d (%.0f per second)' % (
+            self.commands, self.commands / elapsed if elapsed else 0))
+        print('round trip ms   : %s' % summary(self.rtts))
+        print_histogram(self.rtts)
+        print('send interval ms: %s' % summary(self.intervals))
+        print_histogram(self.intervals)
+        idle = sum(gap for _, gap in self.underruns)
+        print('underruns       : %d (%.3f s idle over %.3f s of motion)' % (
+            len(self.underruns), idle, self.motion_time))
+        times = self.path_times()
+        if times:
+            planned = sum(x[1] for x in times)
+            actual = sum(x[2] for x in times)
+            label, p, a = max(times, key=lambda x: x[2] - x[1])
+            print('path times      : %.3f s planned, %.3f s actual, '
+                'worst %s %+.3f s' % (planned, actual, label, a - p))
+
+def motion_duration(args):
+    # seconds of motion a command queues on the board, or None
+    name = args[0]
+    if name in ('XM', 'SM'):
+        return int(args[1]) / 1000
+    if name == 'SP':
+        return int(args[2]) / 1000 if len(args) > 2 else 0
+    if name == 'LM':
+        rate1, steps1, accel1, rate2, steps2, accel2 = map(int, args[1:])
+        ticks1, _ = lm_ticks(rate1, abs(steps1), accel1)
+        ticks2, _ = lm_ticks(rate2, abs(steps2), accel2)
+        return max(ticks1, ticks2) / LM_TICK_HZ
+    return None
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+def summary(seconds):
+    if not seconds:
+        return 'none'
+    ms = [x * 1000 for x in seconds]
+    return 'p50 %.2f, p99 %.2f, max %.2f' % (
+        percentile(ms, 50), percentile(ms, 99), max(ms))
+
+def print_histogram(seconds):
+    counts = [0] * (len(HISTOGRAM_MS) + 1)
+    for x in seconds:
+        ms = x * 1000
+        i = 0
+        while i < len(HISTOGRAM_MS) and ms >= HISTOGRAM_MS[i]:
+            i += 1
+        counts[i] += 1
+    lo = 0
+    for hi, count in zip(HISTOGRAM_MS + (None,), counts):
+        if count:
+            if hi is None:
+                print('  >= %-6g      : %d' % (lo, count))
+            else:
+                print('  %-6g - %-6g : %d' % (lo, hi, count))
+        lo = hi
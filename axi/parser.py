@@ -0,0 +1,178 @@
+from __future__ import division
+
+import warnings
+
+from io import BytesIO
+
+import numpy as np
+
+from .pathset import PathSet
+
+# bytes read from a file at a time. chunks are cut at line boundaries, so a
+# path is never split between two
+CHUNK_SIZE = 1 << 22
+
+# a streaming parser reads text drawings a chunk at a time, one path per
+# line. most chunks are parsed with numpy's C tokenizer: commas and point
+# separators become spaces, every number is read in one call, and the
+# commas on each line give its number of points. the fast path accepts only
+# points of exactly two numbers joined by a comma:
+#
+#   .axi          x,y points separated by whitespace
+#   load_paths    x,y points separated by semicolons, with optional spaces
+#                 around the numbers
+#
+# chunks with comments, quadratic points or anything else go through the
+# line by line parser instead, which also raises the errors for malformed
+# input, so both paths accept the same files
+
+# byte kinds for checking points in a chunk
+SPACE, NUMBER, COMMA, BOUNDARY = range(4)
+
+def read_chunks(fp, size=CHUNK_SIZE):
+    # byte chunks of whole lines from a binary file
+    rest = b''
+    while True:
+        data = fp.read(size)
+        if not data:
+            break
+        data = rest + data
+        end = data.rfind(b'\n') + 1
+        if end:
+            rest = data[end:]
+            yield data[:end]
+        else:
+            rest = data
+    if rest:
+        yield rest
+
+def parse_axi_lines(data):
+    # the .axi format: whitespace separated x,y points or x1,y1,x2,y2
+    # quadratic control and end points, and # comments
+    from .paths import expand_quadratics
+    paths = []
+    for line in data.decode('utf-8').split('\n'):
+        line = line.strip()
+        if line.startswith('#'):
+            continue
+        path = line.split()
+        path = [tuple(map(float, x.split(','))) for x in path]
+        path = expand_quadratics(path)
+        if path:
+            paths.append(path)
+    return paths
+
+def parse_semicolon_lines(data):
+    # the load_paths format: semicolon separated x,y points
+    paths = []
+    for line in data.decode('utf-8').split('\n'):
+        points = [x for x in line.strip().split(';') if x]
+        if not points:
+            continue
+        path = [tuple(map(float, x.split(','))) for x in points]
+        paths.append(path)
+    return paths
+
+def byte_kinds(boundaries):
+    # a table of the kind of each byte value, given the point boundaries
+    table = np.full(256, NUMBER, dtype=np.uint8)
+    for c in bytearray(b' \t\r'):
+        table[c] = SPACE
+    table[ord(',')] = COMMA
+    for c in bytearray(boundaries + b'\n'):
+        table[c] = BOUNDARY
+    return table
+
+def valid_points(buf, separator):
+    # true if every point in a chunk is two numbers joined by a comma.
+    # reduced to the start of each number, commas and point boundaries,
+    # with repeated boundaries merged, a valid chunk reads b(ncnb)*
+    boundaries = b' \t\r' if separator == b' ' else separator
+    kinds = byte_kinds(boundaries)[buf]
+    number = kinds == NUMBER
+    marks = kinds >= COMMA
+    marks[0] |= number[0]
+    marks[1:] |= number[1:] & ~number[:-1]
+    codes = np.concatenate(([BOUNDARY], kinds[marks], [BOUNDARY]))
+    boundary = codes == BOUNDARY
+    codes = codes[np.append(True, ~(boundary[1:] & boundary[:-1]))]
+    if (len(codes) - 1) % 4:
+        return False
+    if not ((codes[1::4] == NUMBER).all() and (codes[2::4] == COMMA).all()
+            and (codes[3::4] == NUMBER).all()):
+        return False
+    if separator != b' ':
+        # spaces alone between two separators make an empty point
+        solid = np.flatnonzero(kinds != SPACE)
+        sep = buf[solid] == ord(separator)
+        gap = np.diff(solid) > 1
+        if (sep[:-1] & sep[1:] & gap).any():
+            return False
+    return True
+
+def parse_chunk(data, separator, parse_lines):
+    # a PathSet of the paths in a chunk of whole lines
+    if not data or b'#' in data:
+        return PathSet.from_paths(parse_lines(data))
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if not valid_points(buf, separator):
+        return PathSet.from_paths(parse_lines(data))
+    ends = np.flatnonzero(buf == ord('\n'))
+    if not len(ends) or ends[-1] != len(buf) - 1:
+        ends = np.append(ends, len(buf))
+    commas = np.flatnonzero(buf == ord(','))
+    text = data.replace(b',', b' ')
+    if separator != b' ':
+        text = text.replace(separator, b' ')
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            values = np.fromstring(text, sep=' ')
+    except (ValueError, DeprecationWarning):
+        values = None
+    if values is None or len(values) != 2 * len(commas):
+        return PathSet.from_paths(parse_lines(data))
+    counts = np.bincount(np.searchsorted(ends, commas), minlength=len(ends))
+    counts = counts[counts > 0]
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return PathSet(values.reshape(-1, 2), offsets)
+
+def iter_axi(fp, size=CHUNK_SIZE):
+    # a PathSet for each chunk of a binary .axi file object
+    for data in read_chunks(fp, size):
+        yield parse_chunk(data, b' ', parse_axi_lines)
+
+def iter_semicolon(fp, size=CHUNK_SIZE):
+    for data in read_chunks(fp, size):
+        yield parse_chunk(data, b';', parse_semicolon_lines)
+
+def join_chunks(chunks):
+    result = None
+    for paths in chunks:
+        if result is None:
+            result = paths
+        else:
+            result.extend(paths)
+    return result or PathSet()
+
+def iter_paths(filename, size=CHUNK_SIZE):
+    # every path of a .axi file as a list of points, one chunk in memory at
+    # a time
+    with open(filename, 'rb') as fp:
+        for paths in iter_axi(fp, size):
+            for path in paths:
+                yield path
+
+def load_axi(filename, size=CHUNK_SIZE):
+    with open(filename, 'rb') as fp:
+        return join_chunks(iter_axi(fp, size))
+
+def loads_axi(data, size=CHUNK_SIZE):
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return join_chunks(iter_axi(BytesIO(data), size))
+
+def load_semicolon(filename, size=CHUNK_SIZE):
+    with open(filename, 'rb') as fp:
+        return join_chunks(iter_semicolon(fp, size))
@@ -2,18 +2,12 @@ from math import hypot
 from pyhull.convex_hull import ConvexHull
 from shapely import geometry
 
+from .parser import load_semicolon
 from .spatial import Index
 
 def load_paths(filename):
-    paths = []
-    with open(filename) as fp:
-        for line in fp:
-            points = filter(None, line.strip().split(';'))
-            if not points:
-                continue
-            path = [tuple(map(float, x.split(','))) for x in points]
-            paths.append(path)
-    return paths
+    # semicolon separated x,y points, one path per line
+    return load_semicolon(filename).tolist()
 
 def path_length(points):
     result = 0
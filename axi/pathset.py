@@ -0,0 +1,158 @@
+from __future__ import division
+
+from itertools import chain
+
+import numpy as np
+
+# text drawings loaded with at least this many points are stored in a path
+# set; smaller ones, and drawings built from lists, keep lists of paths
+PATHSET_POINTS = 100000
+
+# a path set stores paths as a ragged array: one (n, 2) float64 array of
+# coordinates and an int64 offsets array of len(paths) + 1, where path i is
+# coords[offsets[i]:offsets[i + 1]]. it reads like the list of paths it
+# replaces: indexing and iterating give lists of (x, y) tuples, copied from
+# the arrays, and slicing gives a path set that shares them. appends grow the
+# arrays geometrically, copying them the first time if they were passed in
+class PathSet(object):
+    def __init__(self, coords=None, offsets=None):
+        if coords is None:
+            coords = np.zeros((0, 2))
+            offsets = np.zeros(1, dtype=np.int64)
+        coords = np.asarray(coords, dtype=np.float64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        if coords.ndim != 2 or coords.shape[1] != 2:
+            raise Exception('coords must have shape (n, 2)')
+        if offsets.ndim != 1 or len(offsets) < 1:
+            raise Exception('offsets must have shape (paths + 1,)')
+        if offsets[0] != 0 or offsets[-1] != len(coords):
+            raise Exception('offsets must run from 0 to len(coords)')
+        self._coords = coords
+        self._offsets = offsets
+        self.n = len(coords) # points
+        self.m = len(offsets) - 1 # paths
+
+    @classmethod
+    def from_paths(cls, paths):
+        if isinstance(paths, PathSet):
+            return paths
+        paths = list(paths)
+        offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+        np.cumsum([len(path) for path in paths], out=offsets[1:])
+        n = int(offsets[-1])
+        values = chain.from_iterable(chain.from_iterable(paths))
+        coords = np.fromiter(values, dtype=np.float64, count=n * 2)
+        return cls(coords.reshape(-1, 2), offsets)
+
+    @property
+    def coords(self):
+        return self._coords[:self.n]
+
+    @property
+    def offsets(self):
+        return self._offsets[:self.m + 1]
+
+    @property
+    def nbytes(self):
+        return self._coords.nbytes + self._offsets.nbytes
+
+    def __len__(self):
+        return self.m
+
+    def __bool__(self):
+        return self.m > 0
+
+    __nonzero__ = __bool__
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(self.m)
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            stop = max(start, stop)
+            a = self._offsets[start]
+            b = self._offsets[stop]
+            offsets = self._offsets[start:stop + 1] - a
+            return PathSet(self._coords[a:b], offsets)
+        return [tuple(p) for p in self.array(i).tolist()]
+
+    def __iter__(self):
+        coords = self._coords
+        offsets = self.offsets.tolist()
+        for a, b in zip(offsets, offsets[1:]):
+            yield [tuple(p) for p in coords[a:b].tolist()]
+
+    def array(self, i):
+        # path i as a view of the coordinates
+        if i < 0:
+            i += self.m
+        if i < 0 or i >= self.m:
+            raise IndexError('path index out of range')
+        return self._coords[self._offsets[i]:self._offsets[i + 1]]
+
+    def tolist(self):
+        return list(self)
+
+    def append(self, path):
+        self.extend([path])
+
+    def extend(self, paths):
+        paths = PathSet.from_paths(paths)
+        if not paths.m:
+            return
+        n = self.n + paths.n
+        m = self.m + paths.m
+        self.reserve(n, m)
+        self._coords[self.n:n] = paths.coords
+        self._offsets[self.m + 1:m + 1] = paths.offsets[1:] + self.n
+        self.n = n
+        self.m = m
+
+    def reserve(self, n, m):
+        # make room for n points and m paths
+        if n > len(self._coords):
+            coords = np.empty((max(n, 2 * len(self._coords)), 2))
+            coords[:self.n] = self.coords
+            self._coords = coords
+        if m + 1 > len(self._offsets):
+            offsets = np.empty(max(m + 1, 2 * len(self._offsets)),
+                dtype=np.int64)
+            offsets[:self.m + 1] = self.offsets
+            self._offsets = offsets
+
+    def segment_lengths(self):
+        # length of each segment between consecutive points, with the ones
+        # that join the end of a path to the start of the next set to zero
+        d = np.hypot(*np.diff(self.coords, axis=0).T)
+        ends = self.offsets[1:-1] - 1
+        d[ends[(ends >= 0) & (ends < len(d))]] = 0
+        return d
+
+    def lengths(self):
+        # length of each path
+        if not self.n:
+            return np.zeros(self.m)
+        c = np.zeros(self.n)
+        np.cumsum(self.segment_lengths(), out=c[1:])
+        a = self.offsets[:-1]
+        b = np.maximum(self.offsets[1:] - 1, a)
+        return c[np.minimum(b, self.n - 1)] - c[np.minimum(a, self.n - 1)]
+
+    def length(self):
+        return float(self.segment_lengths().sum())
+
+    def jog_length(self):
+        # length of the moves from the end of each path to the next one
+        a = self.offsets[:-1]
+        b = self.offsets[1:]
+        full = b > a
+        starts = self.coords[a[full]]
+        ends = self.coords[b[full] - 1]
+        return float(np.hypot(*(starts[1:] - ends[:-1]).T).sum())
+
+    def bounds(self):
+        if not self.n:
+            return (0, 0, 0, 0)
+        x1, y1 = self.coords.min(axis=0).tolist()
+        x2, y2 = self.coords.max(axis=0).tolist()
+        return (x1, y1, x2, y2)
@@ -0,0 +1,245 @@
+from __future__ import division, print_function
+
+import threading
+import time
+
+from collections import deque
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# a pipeline keeps up to `window` commands in flight on a serial port, so
+# that throughput is bounded by the device rather than by round trip
+# latency. a writer thread sends queued commands and a reader thread matches
+# each response line to the oldest command still waiting for one. errors
+# reported by the device are raised by the next call to submit or flush.
+# if the port fails, or the device sends nothing for `timeout` seconds while
+# commands are in flight, every waiting command fails and the pipeline
+# raises that error from then on
+class Pipeline(object):
+    def __init__(self, serial, window, timeout=None):
+        self.serial = serial
+        self.window = window
+        if timeout is None:
+            timeout = (getattr(serial, 'timeout', None) or 1) * window
+        self.timeout = timeout
+        self.slots = threading.Semaphore(window)
+        # submit blocks once this many commands are waiting to be written,
+        # so the host never runs more than two windows ahead of the device
+        self.outgoing = queue.Queue(window)
+        self.pending = deque() # written, waiting for a response
+        self.lock = threading.Lock()
+        self.last = None
+        self.error = None
+        self.failure = None # raised by every call once set
+        self.active_time = time.time() # last write to an idle device or line
+        self.running = True
+        self.writer = threading.Thread(target=self.write_loop)
+        self.reader = threading.Thread(target=self.read_loop)
+        for thread in (self.writer, self.reader):
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, line, lines=1):
+        # queue a command that expects this many response lines
+        self.check()
+        response = Response(line, lines)
+        while True:
+            try:
+                self.outgoing.put(response, True, self.timeout)
+                break
+            except queue.Full:
+                self.check_stalled()
+                self.check()
+        self.last = response
+        return response
+
+    def wait(self, response):
+        # wait for a response, failing the pipeline if the device stops
+        # answering
+        while not response.wait(self.timeout):
+            self.check_stalled()
+
+    def flush(self):
+        # wait until every submitted command has been answered
+        if self.last is not None:
+            self.wait(self.last)
+        self.check()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.outgoing.put(None)
+            self.running = False
+            self.writer.join()
+            self.reader.join()
+
+    def check(self):
+        if self.failure is not None:
+            raise self.failure
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def check_stalled(self):
+        with self.lock:
+            stalled = self.pending and (
+                time.time() - self.active_time > self.timeout)
+        if stalled:
+            self.fail(Exception(
+                'no response from device for %gs' % self.timeout))
+
+    def fail(self, error):
+        # fail the commands in flight; the writer fails the queued ones
+        with self.lock:
+            if self.failure is None:
+                self.failure = error
+            pending = list(self.pending)
+            self.pending.clear()
+        for response in pending:
+            response.fail(self.failure)
+            self.slots.release()
+
+    def write_loop(self):
+        while True:
+            response = self.outgoing.get()
+            if response is None:
+                break
+            self.slots.acquire()
+            with self.lock:
+                if self.failure is not None:
+                    self.slots.release()
+                    response.fail(self.failure)
+                    continue
+                if not self.pending:
+                    self.active_time = time.time()
+                self.pending.append(response)
+            response.sent_time = time.time()
+            try:
+                self.serial.write((response.command + '\r').encode('utf-8'))
+            except Exception as e:
+                self.fail(e)
+
+    def read_loop(self):
+        while self.running:
+            try:
+                line = self.serial.readline().decode('utf-8').strip()
+            except Exception as e:
+                self.fail(e)
+                break
+            if not line:
+                continue
+            with self.lock:
+                self.active_time = time.time()
+                if not self.pending:
+                    continue
+                response = self.pending[0]
+                response.lines.append(line)
+                if line.startswith('!'):
+                    response.error = Exception(
+                        '%s: %s' % (response.command, line))
+                    self.error = response.error
+                if response.error or len(response.lines) >= response.count:
+                    self.pending.popleft()
+                    self.slots.release()
+                    response.done_time = time.time()
+                    response.event.set()
+
+# a response collects the lines the device sends back for one command
+class Response(object):
+    def __init__(self, command, count):
+        self.command = command
+        self.count = count
+        self.lines = []
+        self.error = None
+        self.sent_time = None # when written to the port
+        self.done_time = None # when the last response line arrived
+        self.event = threading.Event()
+
+    def wait(self, timeout=None):
+        return self.event.wait(timeout)
+
+    def fail(self, error):
+        self.error = error
+        self.done_time = time.time()
+        self.event.set()
+
+    def result(self):
+        self.wait()
+        if self.error is not None:
+            raise self.error
+        return self.lines[0] if self.lines else ''
+
+# a prefetch runs an iterator on a background thread, keeping up to `size`
+# items ready ahead of the consumer. it records how many items were ready
+# each time one was taken, how long each had been ready for (the lead) and
+# how long the consumer had to wait. exceptions are raised to the consumer.
+# a consumer that may stop early closes it, or uses it as a context manager,
+# so that the thread stops instead of blocking on a full queue
+class Prefetch(object):
+    def __init__(self, iterable, size):
+        self.size = size
+        self.queue = queue.Queue(size)
+        self.stopped = False
+        self.depths = []
+        self.leads = []
+        self.wait_time = 0
+        self.thread = threading.Thread(target=self.run, args=(iterable,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self, iterable):
+        try:
+            for item in iterable:
+                self.queue.put((time.time(), item, None))
+                if self.stopped:
+                    return
+        except Exception as e:
+            self.queue.put((time.time(), None, e))
+            return
+        self.queue.put((time.time(), StopIteration, None))
+
+    def close(self):
+        # stop the thread after its current item, dropping the ready ones
+        self.stopped = True
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        depth = self.queue.qsize()
+        start = time.time()
+        ready, item, error = self.queue.get()
+        now = time.time()
+        self.wait_time += now - start
+        if error is not None:
+            raise error
+        if item is StopIteration:
+            raise StopIteration
+        self.depths.append(depth)
+        self.leads.append(now - ready)
+        return item
+
+    next = __next__
+
+    def print_stats(self):
+        n = len(self.depths)
+        depth = sum(self.depths) / n if n else 0
+        lead = sum(self.leads) / n if n else 0
+        print('plan ahead      : %d deep, %.1f ready on average, '
+            '%.3fs mean lead, %.3fs waiting' % (
+            self.size, depth, lead, self.wait_time))
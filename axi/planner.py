@@ -2,21 +2,144 @@ from __future__ import division
 
 from bisect import bisect
 from collections import namedtuple
-from math import sqrt, hypot
+from copy import copy
+from math import asin, atan2, ceil, exp, hypot, log, log1p, sqrt
+from multiprocessing import Pool, cpu_count
+
+import numpy as np
+
+ENGINES = ('python', 'numpy')
+
+# the numpy engine, and plan_time, use the python code for paths with fewer
+# points than this, which is faster for them
+NUMPY_ENGINE_POINTS = 16
+
+# backtrack: lower entry velocities and revisit earlier segments as needed
+# linear: one backward pass then one forward pass, always O(n)
+VELOCITY_PASSES = ('backtrack', 'linear')
+
+# the throttler keeps the distance travelled in each timeslice of length
+# THROTTLE_DT within THROTTLE_THRESHOLD of the path
+THROTTLE_DT = 0.02
+THROTTLE_THRESHOLD = 0.001
+
+# paths with fewer points than this are throttled one vertex at a time in
+# python; longer ones sweep every vertex at once on numpy arrays, which has
+# a fixed cost per call that short paths don't make up for
+THROTTLE_SWEEP_POINTS = 100
+
+# two point paths (jogs) go from rest to rest, so their profile depends only
+# on distance and is planned in closed form. profiles are cached by distance
+# rounded up to a power of (1 + JOG_CACHE_TOLERANCE), and scaled down to the
+# actual distance, so a cached jog is at most that fraction slower than an
+# exact one and never exceeds the acceleration or velocity limits. zero
+# caches exact distances only
+JOG_CACHE_TOLERANCE = 0.001
+JOG_CACHE_SIZE = 65536
+
+# plan_all splits paths into this many shards per worker process, so that
+# workers stay busy when path sizes vary
+SHARDS_PER_PROCESS = 4
 
 # a planner computes a motion profile for a list of (x, y) points
 class Planner(object):
-    def __init__(self, acceleration, max_velocity, corner_factor):
+    def __init__(self, acceleration, max_velocity, corner_factor,
+            engine='python', velocity_pass='backtrack',
+            throttle_dt=THROTTLE_DT, throttle_threshold=THROTTLE_THRESHOLD,
+            cache=None):
+        if engine not in ENGINES:
+            raise Exception('unknown planner engine: %r' % engine)
+        if velocity_pass not in VELOCITY_PASSES:
+            raise Exception('unknown velocity pass: %r' % velocity_pass)
         self.acceleration = acceleration
         self.max_velocity = max_velocity
         self.corner_factor = corner_factor
+        self.engine = engine
+        self.velocity_pass = velocity_pass
+        self.throttle_dt = throttle_dt
+        self.throttle_threshold = throttle_threshold
+        self.cache = cache # e.g. a PlanCache
 
     def plan(self, points):
+        # jogs are cheaper to plan than to look up
+        if self.cache is None or len(points) <= 2:
+            return self.plan_uncached(points)
+        key = self.cache.key(self, points)
+        plan = self.cache.get(key)
+        if plan is None:
+            plan = self.plan_uncached(points)
+            self.cache.put(key, plan)
+        return plan
+
+    def plan_uncached(self, points):
+        if len(points) == 2:
+            plan = jog_plan(points[0], points[1],
+                self.acceleration, self.max_velocity)
+            if self.engine == 'numpy':
+                return plan.compact()
+            return plan
+        if self.engine == 'python':
+            return self.plan_python(points)
+        if len(points) < NUMPY_ENGINE_POINTS:
+            return self.plan_python(points).compact()
+        return CompactPlan.from_arrays(self.plan_arrays(points))
+
+    def plan_python(self, points):
         return constant_acceleration_plan(
-            points, self.acceleration, self.max_velocity, self.corner_factor)
+            points, self.acceleration, self.max_velocity, self.corner_factor,
+            self.velocity_pass == 'linear',
+            self.throttle_dt, self.throttle_threshold)
 
-    def plan_all(self, paths):
-        return [self.plan(path) for path in paths]
+    def plan_arrays(self, points):
+        if len(points) == 2:
+            plan = jog_plan(points[0], points[1],
+                self.acceleration, self.max_velocity)
+            return plan.compact().arrays()
+        if len(points) < NUMPY_ENGINE_POINTS:
+            return self.plan_python(points).compact().arrays()
+        return constant_acceleration_arrays(
+            points, self.acceleration, self.max_velocity, self.corner_factor,
+            self.velocity_pass == 'linear',
+            self.throttle_dt, self.throttle_threshold)
+
+    def plan_time(self, points):
+        # duration of the plan for these points, without building it
+        if 2 < len(points) < NUMPY_ENGINE_POINTS:
+            return self.plan_python(points).t
+        return constant_acceleration_time(
+            points, self.acceleration, self.max_velocity, self.corner_factor,
+            self.velocity_pass == 'linear',
+            self.throttle_dt, self.throttle_threshold)
+
+    def plan_all(self, paths, processes=1):
+        # plan many paths, in order. with more than one process (None for
+        # one per cpu) the paths are shipped to a pool of workers as flat
+        # coordinate arrays and the results come back as CompactPlans
+        if processes is None:
+            processes = cpu_count()
+        if processes <= 1 or len(paths) <= 1:
+            return [self.plan(path) for path in paths]
+        plans = [None] * len(paths)
+        keys = [None] * len(paths)
+        todo = []
+        for i, path in enumerate(paths):
+            if self.cache is not None and len(path) > 2:
+                keys[i] = self.cache.key(self, path)
+                plans[i] = self.cache.get(keys[i])
+            if plans[i] is None:
+                todo.append(i)
+        # workers plan without the cache, so lookups and counts stay here
+        planner = copy(self)
+        planner.cache = None
+        planned = []
+        if todo:
+            planned = plan_parallel(planner, [paths[i] for i in todo],
+                processes)
+        for i, plan in zip(todo, planned):
+            plans[i] = plan
+            if keys[i] is not None:
+                self.cache.put(keys[i], plan)
+        return plans
 
 # a plan is a motion profile generated by the planner
 class Plan(object):
@@ -34,11 +157,228 @@ class Plan(object):
         self.t = t # total time
         self.s = s # total duration
 
+    @classmethod
+    def from_arrays(cls, arrays):
+        blocks = []
+        for a, t, vi, x1, y1, x2, y2 in zip(*[x.tolist() for x in arrays]):
+            blocks.append(Block(a, t, vi, Point(x1, y1), Point(x2, y2)))
+        return cls(blocks)
+
     def instant(self, t):
         t = max(0, min(self.t, t)) # clamp t
         i = bisect(self.ts, t) - 1 # find block for t
         return self.blocks[i].instant(t - self.ts[i], self.ts[i], self.ss[i])
 
+    def compact(self):
+        return CompactPlan.from_plan(self)
+
+    def sample(self, times):
+        return self.compact().sample(times)
+
+    def positions(self, dt):
+        return self.compact().positions(dt)
+
+# a compact plan holds the same motion profile as a plan, but stores the
+# blocks as parallel numpy arrays instead of Block and Point objects
+class CompactPlan(object):
+    ARRAYS = ('a', 'dt', 'vi', 'x1', 'y1', 'x2', 'y2')
+
+    def __init__(self, a, t, vi, x1, y1, x2, y2):
+        self.a = np.asarray(a, dtype=float)
+        self.dt = np.asarray(t, dtype=float) # duration of each block
+        self.vi = np.asarray(vi, dtype=float)
+        self.x1 = np.asarray(x1, dtype=float)
+        self.y1 = np.asarray(y1, dtype=float)
+        self.x2 = np.asarray(x2, dtype=float)
+        self.y2 = np.asarray(y2, dtype=float)
+        self.ds = np.hypot(self.x2 - self.x1, self.y2 - self.y1)
+        self.ts = np.zeros(len(self.dt)) # start time of each block
+        self.ss = np.zeros(len(self.ds)) # start distance of each block
+        np.cumsum(self.dt[:-1], out=self.ts[1:])
+        np.cumsum(self.ds[:-1], out=self.ss[1:])
+        self.t = float(self.ts[-1] + self.dt[-1]) if len(self.dt) else 0
+        self.s = float(self.ss[-1] + self.ds[-1]) if len(self.ds) else 0
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(*arrays)
+
+    @classmethod
+    def from_plan(cls, plan):
+        if isinstance(plan, CompactPlan):
+            return plan
+        columns = [[] for _ in cls.ARRAYS]
+        for b in plan.blocks:
+            row = (b.a, b.t, b.vi, b.p1.x, b.p1.y, b.p2.x, b.p2.y)
+            for column, value in zip(columns, row):
+                column.append(value)
+        return cls(*columns)
+
+    @classmethod
+    def concatenate(cls, plans):
+        # join plans end to end into a single plan
+        plans = [cls.from_plan(x) for x in plans]
+        if not plans:
+            return cls(*[[] for _ in cls.ARRAYS])
+        return cls(*[np.concatenate([getattr(x, name) for x in plans])
+            for name in cls.ARRAYS])
+
+    def __add__(self, other):
+        return CompactPlan.concatenate([self, other])
+
+    def __len__(self):
+        return len(self.dt)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.block(i)
+
+    @property
+    def blocks(self):
+        return list(self)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes
+            for name in self.ARRAYS + ('ds', 'ts', 'ss'))
+
+    def arrays(self):
+        return BlockArrays(*[getattr(self, name) for name in self.ARRAYS])
+
+    def block(self, i):
+        p1 = Point(float(self.x1[i]), float(self.y1[i]))
+        p2 = Point(float(self.x2[i]), float(self.y2[i]))
+        return Block(float(self.a[i]), float(self.dt[i]), float(self.vi[i]),
+            p1, p2)
+
+    def instant(self, t):
+        t = max(0, min(self.t, t)) # clamp t
+        i = int(np.searchsorted(self.ts, t, 'right')) - 1 # find block for t
+        ts = float(self.ts[i])
+        return self.block(i).instant(t - ts, ts, float(self.ss[i]))
+
+    def sample(self, times):
+        # evaluate the plan at many times at once. equivalent to calling
+        # instant(t) for each t, but returns Samples of arrays
+        times = np.clip(np.asarray(times, dtype=float), 0, self.t)
+        if not len(self):
+            zeros = np.zeros(len(times))
+            return Samples(times, zeros, zeros, zeros, zeros, zeros)
+        i = np.searchsorted(self.ts, times, 'right') - 1 # find block for t
+        i = np.clip(i, 0, len(self) - 1)
+        ts = self.ts[i]
+        ds = self.ds[i]
+        a = self.a[i]
+        vi = self.vi[i]
+        t = np.clip(times - ts, 0, self.dt[i])
+        v = vi + a * t
+        s = vi * t + a * t * t / 2
+        s = np.clip(s, 0, ds)
+        x1 = self.x1[i]
+        y1 = self.y1[i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ux = np.where(ds > 0, (self.x2[i] - x1) / ds, 0)
+            uy = np.where(ds > 0, (self.y2[i] - y1) / ds, 0)
+        return Samples(t + ts, x1 + ux * s, y1 + uy * s, s + self.ss[i], v, a)
+
+    def times(self, dt):
+        # 0, dt, 2 * dt, ... up to the first time >= self.t, accumulated the
+        # same way as a loop that does t += dt
+        n = int(self.t // dt) + 3
+        times = np.zeros(n)
+        times[1:] = dt
+        times = np.cumsum(times)
+        n = np.searchsorted(times, self.t, 'left') + 1
+        return times[:n]
+
+    def positions(self, dt):
+        # positions every dt seconds, from the start of the plan through the
+        # first sample at or past the end
+        samples = self.sample(self.times(dt))
+        return samples.x, samples.y
+
+    def compact(self):
+        return self
+
+    def to_plan(self):
+        return Plan(self.blocks)
+
+    def save(self, file):
+        save_plans(file, [self])
+
+    @classmethod
+    def load(cls, file):
+        return load_plans(file)[0]
+
+def save_plans(file, plans):
+    # save a list of plans, e.g. a whole drawing, to a single .npz file
+    plans = [CompactPlan.from_plan(x) for x in plans]
+    counts = np.array([len(x) for x in plans], dtype=np.int64)
+    plan = CompactPlan.concatenate(plans)
+    arrays = dict((name, getattr(plan, name)) for name in plan.ARRAYS)
+    np.savez(file, counts=counts, **arrays)
+
+def load_plans(file):
+    with np.load(file) as data:
+        counts = data['counts']
+        arrays = [data[name] for name in CompactPlan.ARRAYS]
+    return split_plans(counts, arrays)
+
+def plan_parallel(planner, paths, processes):
+    coords, offsets = flatten_paths(paths)
+    shards = shard_offsets(offsets, processes * SHARDS_PER_PROCESS)
+    jobs = [(planner, coords[offsets[i]:offsets[j]],
+        offsets[i:j + 1] - offsets[i]) for i, j in shards]
+    pool = Pool(processes)
+    try:
+        results = pool.map(plan_shard, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    plans = []
+    for counts, arrays in results:
+        plans.extend(split_plans(counts, arrays))
+    return plans
+
+def flatten_paths(paths):
+    # all points in one (n, 2) array, with path i at offsets[i]:offsets[i+1]
+    counts = [len(path) for path in paths]
+    offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    coords = np.zeros((offsets[-1], 2))
+    for path, i, j in zip(paths, offsets, offsets[1:]):
+        if j > i:
+            coords[i:j] = path
+    return coords, offsets
+
+def shard_offsets(offsets, count):
+    # split paths into at most count contiguous (start, end) index ranges
+    # with roughly equal numbers of points
+    n = len(offsets) - 1
+    targets = np.linspace(0, offsets[-1], count + 1)[1:-1]
+    cuts = np.searchsorted(offsets, targets)
+    cuts = np.unique(np.concatenate([[0], cuts, [n]]))
+    return list(zip(cuts[:-1].tolist(), cuts[1:].tolist()))
+
+def plan_shard(job):
+    # runs in a worker process: plan each path in a shard and return the
+    # block counts and concatenated block arrays
+    planner, coords, offsets = job
+    plans = []
+    for i, j in zip(offsets, offsets[1:]):
+        points = coords[i:j]
+        if planner.engine == 'python':
+            points = points.tolist()
+        plans.append(CompactPlan.from_plan(planner.plan(points)))
+    counts = np.array([len(x) for x in plans], dtype=np.int64)
+    return counts, CompactPlan.concatenate(plans).arrays()
+
+def split_plans(counts, arrays):
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return [CompactPlan(*[x[i:j] for x in arrays])
+        for i, j in zip(offsets, offsets[1:])]
+
 # a block is a constant acceleration for a duration of time
 class Block(object):
     def __init__(self, a, t, vi, p1, p2):
@@ -61,6 +401,9 @@ class Block(object):
 # an instant gives position, velocity, etc. at a single point in time
 Instant = namedtuple('Instant', ['t', 'p', 's', 'v', 'a'])
 
+# samples give the same values as instants, as arrays over many times
+Samples = namedtuple('Samples', ['t', 'x', 'y', 's', 'v', 'a'])
+
 # a = acceleration
 # v = velocity
 # s = distance
@@ -174,66 +517,246 @@ class Segment(object):
         self.blocks = []
 
 class Throttler(object):
+    # the throttler limits the velocity at each vertex so that the straight
+    # line travelled during one timeslice (dt) stays within threshold of the
+    # path. each vertex sweeps forward along the path, narrowing the cone of
+    # chord directions that keep every vertex passed over within threshold,
+    # until the chord would be longer than vmax * dt or no chord to the
+    # current segment is feasible. long paths sweep all vertices together
     def __init__(self, points, vmax, dt, threshold):
-        self.points = points
         self.vmax = vmax
         self.dt = dt
         self.threshold = threshold
-        self.distances = []
-        prev = points[0]
-        d = 0
-        for point in points:
-            d += prev.distance(point)
-            self.distances.append(d)
-            prev = point
-    def lookup(self, d):
-        return bisect(self.distances, d) - 1
-    def is_feasible(self, i0, v):
-        d = v * self.dt
-        x0 = self.distances[i0]
-        x1 = x0 + d
-        i1 = self.lookup(x1)
-        if i0 == i1:
+        self.vectorized = len(points) >= THROTTLE_SWEEP_POINTS
+        if not self.vectorized:
+            self.init_lists(points)
+            return
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.x = x = np.ascontiguousarray(self.points[:, 0])
+        self.y = y = np.ascontiguousarray(self.points[:, 1])
+        self.lengths = np.hypot(np.diff(x), np.diff(y))
+        self.distances = np.zeros(len(x))
+        self.distances[1:] = np.cumsum(self.lengths)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.ux = np.where(self.lengths > 0, np.diff(x) / self.lengths, 0)
+            self.uy = np.where(self.lengths > 0, np.diff(y) / self.lengths, 0)
+
+    def init_lists(self, points):
+        self.points = points
+        self.x = x = [float(p[0]) for p in points]
+        self.y = y = [float(p[1]) for p in points]
+        self.lengths = []
+        self.distances = [0.0]
+        self.ux = []
+        self.uy = []
+        for x1, y1, x2, y2 in zip(x, y, x[1:], y[1:]):
+            d = hypot(x2 - x1, y2 - y1)
+            self.lengths.append(d)
+            self.distances.append(self.distances[-1] + d)
+            self.ux.append((x2 - x1) / d if d > 0 else 0)
+            self.uy.append((y2 - y1) / d if d > 0 else 0)
+
+    def is_feasible(self, i0, seg, u, state):
+        # can the chord from vertex i0 end at offset u along segment seg?
+        rx, ry, lo, hi, rmax = state
+        x0 = self.x[i0]
+        y0 = self.y[i0]
+        ex = self.x[seg] + self.ux[seg] * u
+        ey = self.y[seg] + self.uy[seg] * u
+        dx = ex - x0
+        dy = ey - y0
+        r = np.hypot(dx, dy)
+        ok = r >= rmax - self.threshold
+        theta = relative_angle(rx, ry, dx, dy)
+        ok &= (theta >= lo) & (theta <= hi)
+        # the cone only bounds the distance to the chord's line. if a vertex
+        # may lie beyond the end of the chord, check each vertex exactly
+        band = ok & (r < rmax)
+        if band.any():
+            ok[band] = self.check_chords(
+                i0[band], seg[band], ex[band], ey[band])
+        return ok
+
+    def check_chords(self, i0, seg, ex, ey):
+        x0 = self.x[i0]
+        y0 = self.y[i0]
+        wx = ex - x0
+        wy = ey - y0
+        l2 = wx * wx + wy * wy
+        ok = np.ones(len(i0), dtype=bool)
+        for k in range(1, (seg - i0).max() + 1):
+            j = np.minimum(i0 + k, seg)
+            px = self.x[j] - x0
+            py = self.y[j] - y0
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = np.clip((px * wx + py * wy) / l2, 0, 1)
+            t[l2 == 0] = 0
+            d = np.hypot(px - t * wx, py - t * wy)
+            ok &= d <= self.threshold
+        return ok
+
+    def constrain(self, i0, j, state):
+        # narrow each cone so that the chord passes within threshold of j.
+        # angles are relative to the unit vector (rx, ry), which is the
+        # direction to the first vertex that constrains the cone
+        rx, ry, lo, hi, rmax = state
+        dx = self.x[j] - self.x[i0]
+        dy = self.y[j] - self.y[i0]
+        r = np.hypot(dx, dy)
+        far = r > self.threshold
+        if far.all():
+            i = slice(None)
+        elif far.any():
+            i = np.flatnonzero(far)
+            dx = dx[i]
+            dy = dy[i]
+            r = r[i]
+        else:
+            return
+        new = (rx[i] == 0) & (ry[i] == 0)
+        if new.any():
+            rx[i] = np.where(new, dx / r, rx[i])
+            ry[i] = np.where(new, dy / r, ry[i])
+        half = np.arcsin(self.threshold / r)
+        phi = relative_angle(rx[i], ry[i], dx, dy)
+        lo[i] = np.maximum(lo[i], phi - half)
+        hi[i] = np.minimum(hi[i], phi + half)
+        rmax[i] = np.maximum(rmax[i], r)
+
+    def max_distance(self, i0, seg, u, state):
+        # largest feasible offset in [0, u] along each segment
+        lo = np.zeros(len(i0))
+        hi = u
+        for _ in range(16):
+            mid = (lo + hi) / 2
+            ok = self.is_feasible(i0, seg, mid, state)
+            lo = np.where(ok, mid, lo)
+            hi = np.where(ok, hi, mid)
+        return lo
+
+    def compute_max_velocities(self):
+        n = len(self.points)
+        if n < 2:
+            return [self.vmax] * n
+        if not self.vectorized:
+            dmax = self.vmax * self.dt
+            return [min(self.vmax, self.max_chord(i) / self.dt)
+                for i in range(n - 1)] + [min(self.vmax, dmax / self.dt)]
+        dmax = self.vmax * self.dt
+        result = np.full(n, dmax)
+        i0 = np.arange(n - 1)
+        state = (np.zeros(n - 1), np.zeros(n - 1), np.full(n - 1, -np.inf),
+            np.full(n - 1, np.inf), np.zeros(n - 1))
+        stopped = []
+        k = 0
+        while len(i0):
+            seg = i0 + k
+            base = self.distances[seg] - self.distances[i0]
+            u = np.minimum(self.lengths[seg], dmax - base)
+            ok = self.is_feasible(i0, seg, u, state)
+            # done: the chord reaches vmax * dt or the end of the path
+            done = ok & ((base + u >= dmax) | (seg + 1 == n - 1))
+            # infeasible: the furthest feasible point is on this segment
+            bad = ~ok
+            stopped.append([x[bad] for x in (i0, seg, u, base) + state])
+            keep = ~(done | bad)
+            i0 = i0[keep]
+            state = tuple(x[keep] for x in state)
+            k += 1
+            if len(i0):
+                self.constrain(i0, i0 + k, state)
+        if stopped:
+            i0, seg, u, base, rx, ry, lo, hi, rmax = [
+                np.concatenate(x) for x in zip(*stopped)]
+            d = self.max_distance(i0, seg, u, (rx, ry, lo, hi, rmax))
+            result[i0] = base + d
+        return np.minimum(self.vmax, result / self.dt).tolist()
+
+    # the same sweep for one vertex at a time, on python floats
+
+    def max_chord(self, i0):
+        # length along the path of the longest feasible chord from i0
+        n = len(self.x)
+        dmax = self.vmax * self.dt
+        state = [0.0, 0.0, -float('inf'), float('inf'), 0.0]
+        k = 0
+        while True:
+            seg = i0 + k
+            base = self.distances[seg] - self.distances[i0]
+            u = min(self.lengths[seg], dmax - base)
+            if not self.chord_feasible(i0, seg, u, state):
+                lo = 0.0
+                hi = u
+                for _ in range(16):
+                    mid = (lo + hi) / 2
+                    if self.chord_feasible(i0, seg, mid, state):
+                        lo = mid
+                    else:
+                        hi = mid
+                return base + lo
+            if base + u >= dmax or seg + 1 == n - 1:
+                return dmax
+            k += 1
+            self.constrain_chord(i0, i0 + k, state)
+
+    def chord_feasible(self, i0, seg, u, state):
+        rx, ry, lo, hi, rmax = state
+        x0 = self.x[i0]
+        y0 = self.y[i0]
+        ex = self.x[seg] + self.ux[seg] * u
+        ey = self.y[seg] + self.uy[seg] * u
+        dx = ex - x0
+        dy = ey - y0
+        r = hypot(dx, dy)
+        if r < rmax - self.threshold:
+            return False
+        theta = atan2(rx * dy - ry * dx, rx * dx + ry * dy)
+        if theta < lo or theta > hi:
+            return False
+        if r >= rmax:
             return True
-        p0 = self.points[i0]
-        p10 = self.points[i1]
-        try:
-            p11 = self.points[i1+1]
-        except IndexError:
-            p11 = p10
-        s = x1 - self.distances[i1]
-        p1 = p10.lerps(p11, s)
-        i = i0 + 1
-        while i <= i1:
-            p = self.points[i]
-            if p.segment_distance(p0, p1) > self.threshold:
+        # a vertex may lie beyond the end of the chord
+        wx = dx
+        wy = dy
+        l2 = wx * wx + wy * wy
+        for j in range(i0 + 1, seg + 1):
+            px = self.x[j] - x0
+            py = self.y[j] - y0
+            t = 0
+            if l2 != 0:
+                t = max(0, min(1, (px * wx + py * wy) / l2))
+            if hypot(px - t * wx, py - t * wy) > self.threshold:
                 return False
-            i += 1
         return True
-    def compute_max_velocity(self, index):
-        if self.is_feasible(index, self.vmax):
-            return self.vmax
-        lo = 0
-        hi = self.vmax
-        for _ in range(16):
-            v = (lo + hi) / 2
-            if self.is_feasible(index, v):
-                lo = v
-            else:
-                hi = v
-        v = lo
-        return v
-    def compute_max_velocities(self):
-        return [self.compute_max_velocity(i) for i in range(len(self.points))]
 
-def constant_acceleration_plan(points, a, vmax, cf):
+    def constrain_chord(self, i0, j, state):
+        dx = self.x[j] - self.x[i0]
+        dy = self.y[j] - self.y[i0]
+        r = hypot(dx, dy)
+        if r <= self.threshold:
+            return
+        if state[0] == 0 and state[1] == 0:
+            state[0] = dx / r
+            state[1] = dy / r
+        rx, ry = state[0], state[1]
+        half = asin(self.threshold / r)
+        phi = atan2(rx * dy - ry * dx, rx * dx + ry * dy)
+        state[2] = max(state[2], phi - half)
+        state[3] = min(state[3], phi + half)
+        state[4] = max(state[4], r)
+
+def relative_angle(rx, ry, dx, dy):
+    # signed angle from the unit vector (rx, ry) to (dx, dy), in [-pi, pi]
+    return np.arctan2(rx * dy - ry * dx, rx * dx + ry * dy)
+
+def constant_acceleration_plan(points, a, vmax, cf, linear=False,
+        dt=THROTTLE_DT, threshold=THROTTLE_THRESHOLD):
     # make sure points are Point objects
     points = [Point(x, y) for x, y in points]
 
     # the throttler reduces speeds based on the discrete timeslicing nature of
     # the device
-    # TODO: expose parameters
-    throttler = Throttler(points, vmax, 0.02, 0.001)
+    throttler = Throttler(points, vmax, dt, threshold)
     max_velocities = throttler.compute_max_velocities()
 
     # create segments for each consecutive pair of points
@@ -248,6 +771,16 @@ def constant_acceleration_plan(points, a, vmax, cf):
     # add a dummy segment at the end to force a final velocity of zero
     segments.append(Segment(points[-1], points[-1]))
 
+    if linear:
+        # backward pass: lower each max_entry_velocity so that the segment
+        # can always decelerate to the next one. the forward pass below will
+        # then never need to backtrack
+        for i in range(len(segments) - 2, -1, -1):
+            segment = segments[i]
+            vexit = segments[i + 1].max_entry_velocity
+            v = sqrt(vexit * vexit + 2 * a * segment.length)
+            segment.max_entry_velocity = min(segment.max_entry_velocity, v)
+
     # loop over segments
     i = 0
     while i < len(segments) - 1:
@@ -302,3 +835,262 @@ def constant_acceleration_plan(points, a, vmax, cf):
     # filter out zero-duration blocks and return
     blocks = [b for b in blocks if b.t > EPS]
     return Plan(blocks)
+
+class JogCache(object):
+    # rest to rest profiles, keyed by (rounded distance, a, vmax)
+    def __init__(self, tolerance=JOG_CACHE_TOLERANCE, size=JOG_CACHE_SIZE):
+        self.tolerance = tolerance
+        self.size = size
+        self.profiles = {}
+        self.hits = 0
+        self.misses = 0
+
+    def profile(self, s, a, vmax):
+        # returns ((t1, t2, t3, vpeak, s1), k) where the profile is for a
+        # distance of s / k, with k <= 1. accelerate for t1 over s1, cruise
+        # at vmax for t2 and decelerate for t3. t2 is None for a triangle
+        k = 1.0
+        if self.tolerance and s > 0:
+            base = log1p(self.tolerance)
+            n = int(ceil(log(s) / base))
+            sq = exp(n * base)
+            if sq < s:
+                sq = exp((n + 1) * base)
+            k = s / sq
+            s = sq
+        key = (s, a, vmax)
+        profile = self.profiles.get(key)
+        if profile is not None:
+            self.hits += 1
+            return profile, k
+        self.misses += 1
+        if len(self.profiles) >= self.size:
+            self.profiles.clear()
+        profile = self.profiles[key] = rest_to_rest_profile(s, a, vmax)
+        return profile, k
+
+    def clear(self):
+        self.profiles.clear()
+        self.hits = 0
+        self.misses = 0
+
+jog_cache = JogCache()
+
+def rest_to_rest_profile(s, a, vmax):
+    # the profile constant_acceleration_plan produces for a single segment
+    s1 = (2 * a * s) / (4 * a)
+    vpeak = (2 * a * s1) ** 0.5
+    if vpeak > vmax:
+        t1 = vmax / a
+        s1 = vmax / 2 * t1
+        t2 = (s - s1 - s1) / vmax
+        return (t1, t2, t1, vmax, s1)
+    t1 = vpeak / a
+    return (t1, None, t1, vpeak, s1)
+
+def jog_plan(p1, p2, a, vmax, cache=None):
+    # closed form plan for a straight move from rest at p1 to rest at p2
+    cache = cache or jog_cache
+    p1 = Point(float(p1[0]), float(p1[1]))
+    p2 = Point(float(p2[0]), float(p2[1]))
+    s = p1.distance(p2)
+    (t1, t2, t3, vpeak, s1), k = cache.profile(s, a, vmax)
+    q1 = p1.lerps(p2, s1 * k)
+    if t2 is not None:
+        q2 = p1.lerps(p2, s - s1 * k)
+        blocks = [
+            Block(a * k, t1, 0, p1, q1),
+            Block(0, t2, vmax * k, q1, q2),
+            Block(-a * k, t3, vmax * k, q2, p2),
+        ]
+    else:
+        blocks = [
+            Block(a * k, t1, 0, p1, q1),
+            Block(-a * k, t3, vpeak * k, q1, p2),
+        ]
+    return Plan([b for b in blocks if b.t > EPS])
+
+# block profiles as parallel columns, one row per block
+BlockArrays = namedtuple('BlockArrays',
+    ['a', 't', 'vi', 'x1', 'y1', 'x2', 'y2'])
+
+def empty_block_arrays():
+    return BlockArrays(*[np.zeros(0) for _ in BlockArrays._fields])
+
+def corner_velocities(vectors, vmax, a, delta):
+    # vectorized version of corner_velocity for each consecutive pair of
+    # segment unit vectors
+    cosine = -(vectors[:-1] * vectors[1:]).sum(axis=1)
+    sine = np.sqrt(np.clip((1 - cosine) / 2, 0, 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        v = np.sqrt((a * delta * sine) / (1 - sine))
+    v = np.minimum(v, vmax)
+    v[np.abs(sine - 1) < EPS] = vmax
+    v[np.abs(cosine - 1) < EPS] = 0
+    return v
+
+def segment_velocities(points, a, vmax, cf, linear=False,
+        dt=THROTTLE_DT, threshold=THROTTLE_THRESHOLD):
+    # the first half of constant_acceleration_arrays: returns segment
+    # lengths and unit vectors, the entry velocity of each segment plus a
+    # final zero, and whether each segment only accelerates
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    throttler = Throttler(points, vmax, dt, threshold)
+    max_velocities = throttler.compute_max_velocities()
+
+    # segment lengths and unit vectors
+    p1 = points[:-1]
+    p2 = points[1:]
+    d = p2 - p1
+    lengths = np.hypot(d[:, 0], d[:, 1])
+    vectors = np.zeros_like(d)
+    nonzero = lengths > 0
+    vectors[nonzero] = d[nonzero] / lengths[nonzero, None]
+
+    # max entry velocity for each segment, plus a dummy segment at the end
+    # to force a final velocity of zero
+    n = len(lengths)
+    max_entry = np.zeros(n + 1)
+    max_entry[1:n] = corner_velocities(vectors, vmax, a, cf)
+    max_entry[:n - 1] = np.minimum(max_entry[:n - 1], max_velocities[:n - 1])
+
+    if linear:
+        entry, full = linear_velocities(lengths, max_entry, a)
+    else:
+        entry, full = backtracking_velocities(lengths.tolist(),
+            max_entry.tolist(), a)
+        entry = np.array(entry)
+        full = np.array(full, dtype=bool)
+    return lengths, vectors, entry, full
+
+def constant_acceleration_arrays(points, a, vmax, cf, linear=False,
+        dt=THROTTLE_DT, threshold=THROTTLE_THRESHOLD):
+    # same motion profile as constant_acceleration_plan, but computed on
+    # numpy arrays and returned as BlockArrays
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(points) < 2:
+        return empty_block_arrays()
+    lengths, vectors, entry, full = segment_velocities(
+        points, a, vmax, cf, linear, dt, threshold)
+    p1 = points[:-1]
+    p2 = points[1:]
+    n = len(lengths)
+
+    # classify each segment's profile
+    vi = entry[:-1]
+    vf = entry[1:]
+    s = lengths
+    s1 = (2 * a * s + vf * vf - vi * vi) / (4 * a)
+    vpeak = np.sqrt(np.maximum(vi * vi + 2 * a * s1, 0))
+    trap = ~full & (vpeak > vmax)
+    tri = ~full & ~trap
+
+    # accelerate, cruise and decelerate phases for every segment; phases
+    # that a profile doesn't use get a zero duration and are dropped below
+    t1 = np.where(full, (vf - vi) / a,
+        np.where(trap, (vmax - vi) / a, (vpeak - vi) / a))
+    sa = np.where(full, s, np.where(trap, (vmax + vi) / 2 * t1, s1))
+    t3 = np.where(trap, (vf - vmax) / -a, (vf - vpeak) / -a)
+    t3[full] = 0
+    s3 = np.where(trap, (vf + vmax) / 2 * t3, 0)
+    t2 = np.where(trap, (s - sa - s3) / vmax, 0)
+    sc = np.where(trap, s - s3, sa)
+    vd = np.where(trap, vmax, vpeak)
+
+    xa = p1[:, 0] + vectors[:, 0] * sa
+    ya = p1[:, 1] + vectors[:, 1] * sa
+    xa[full] = p2[full, 0]
+    ya[full] = p2[full, 1]
+    xc = p1[:, 0] + vectors[:, 0] * sc
+    yc = p1[:, 1] + vectors[:, 1] * sc
+    xc[tri] = xa[tri]
+    yc[tri] = ya[tri]
+
+    zeros = np.zeros(n)
+    columns = [
+        (np.full(n, float(a)), zeros, -np.full(n, float(a))),
+        (t1, t2, t3),
+        (vi, np.full(n, float(vmax)), vd),
+        (p1[:, 0], xa, xc),
+        (p1[:, 1], ya, yc),
+        (xa, xc, p2[:, 0]),
+        (ya, yc, p2[:, 1]),
+    ]
+    columns = [np.column_stack(x).ravel() for x in columns]
+
+    # filter out zero-duration blocks and return
+    keep = columns[1] > EPS
+    return BlockArrays(*[x[keep] for x in columns])
+
+def constant_acceleration_time(points, a, vmax, cf, linear=False,
+        dt=THROTTLE_DT, threshold=THROTTLE_THRESHOLD):
+    # total duration of the constant_acceleration_arrays profile, summed from
+    # the segment entry velocities without building any blocks
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    if len(points) < 2:
+        return 0.0
+    if len(points) == 2:
+        s = float(np.hypot(*(points[1] - points[0])))
+        t1, t2, t3, _, _ = rest_to_rest_profile(s, a, vmax)
+        return t1 + (t2 or 0) + t3
+    lengths, _, entry, full = segment_velocities(
+        points, a, vmax, cf, linear, dt, threshold)
+    vi = entry[:-1]
+    vf = entry[1:]
+    s = lengths
+    s1 = (2 * a * s + vf * vf - vi * vi) / (4 * a)
+    vpeak = np.sqrt(np.maximum(vi * vi + 2 * a * s1, 0))
+    trap = ~full & (vpeak > vmax)
+    cruise = s - (2 * vmax * vmax - vi * vi - vf * vf) / (2 * a)
+    t = np.where(full, (vf - vi) / a,
+        np.where(trap, (2 * vmax - vi - vf) / a + cruise / vmax,
+        (2 * vpeak - vi - vf) / a))
+    return float(t.sum())
+
+def backtracking_velocities(lengths, max_entry, a):
+    # compute the entry velocity of each segment using the same backtracking
+    # loop as constant_acceleration_plan; full[i] is set when segment i only
+    # accelerates
+    n = len(lengths)
+    entry = [0] * (n + 1)
+    full = [False] * n
+    i = 0
+    while i < n:
+        s = lengths[i]
+        vi = entry[i]
+        vexit = max_entry[i + 1]
+        s1 = (2 * a * s + vexit * vexit - vi * vi) / (4 * a)
+        if s1 < -EPS:
+            # too fast! update max_entry_velocity and backtrack
+            max_entry[i] = sqrt(vexit * vexit + 2 * a * s)
+            i -= 1
+        elif s1 > s:
+            # accelerate
+            entry[i + 1] = sqrt(vi * vi + 2 * a * s)
+            full[i] = True
+            i += 1
+        else:
+            entry[i + 1] = vexit
+            full[i] = False
+            i += 1
+    return entry, full
+
+def linear_velocities(lengths, max_entry, a):
+    # compute the entry velocity of each segment with a backward pass
+    # (deceleration limits) and a forward pass (acceleration limits).
+    # working with squared velocities, each pass is a running minimum:
+    #   backward: m[i] = min(c[i], m[i + 1] + 2 * a * s[i])
+    #   forward:  e[i + 1] = min(m[i + 1], e[i] + 2 * a * s[i])
+    c = max_entry * max_entry
+    ds = 2 * a * lengths
+    d = np.zeros(len(c))
+    d[:-1] = np.cumsum(ds[::-1])[::-1]
+    m = d + np.minimum.accumulate((c - d)[::-1])[::-1]
+    m = np.minimum(m, c)
+    p = np.zeros(len(c))
+    p[1:] = np.cumsum(ds)
+    e = p + np.minimum.accumulate(m - p)
+    e = np.clip(e, 0, m)
+    e[0] = 0
+    full = e[:-1] + ds < m[1:]
+    return np.sqrt(e), full
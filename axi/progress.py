@@ -8,18 +8,27 @@ def pretty_time(seconds):
     h = (seconds / 3600)
     return '%d:%02d:%02d' % (h, m, s)
 
+# minimum seconds between redraws, so that frequent updates stay cheap
+REDRAW_INTERVAL = 0.1
+
 class Bar(object):
 
-    def __init__(self, max_value=100, min_value=0, enabled=True):
+    def __init__(self, max_value=100, min_value=0, enabled=True,
+            interval=REDRAW_INTERVAL, timed=False):
         self.min_value = min_value
         self.max_value = max_value
         self.value = min_value
         self.start_time = time.time()
         self.end_time = None
         self.enabled = enabled
+        self.interval = interval
+        self.timed = timed # values are seconds
+        self.render_time = None
 
     @property
     def percent_complete(self):
+        if self.max_value == self.min_value:
+            return 100.0
         return 100.0 * (self.value - self.min_value) / (self.max_value - self.min_value)
 
     @property
@@ -49,14 +58,20 @@ class Bar(object):
     def increment(self, delta):
         self.update(self.value + delta)
 
-    def update(self, value):
+    def update(self, value, force=False):
         self.value = value
-        if self.enabled:
-            sys.stdout.write('  %s    \r' % self.render())
-            sys.stdout.flush()
+        if not self.enabled:
+            return
+        now = time.time()
+        if self.render_time is not None and not force:
+            if now - self.render_time < self.interval:
+                return
+        self.render_time = now
+        sys.stdout.write('  %s    \r' % self.render())
+        sys.stdout.flush()
 
     def done(self):
-        self.update(self.max_value)
+        self.update(self.max_value, True)
         self.stop()
 
     def stop(self):
@@ -77,6 +92,9 @@ class Bar(object):
         return '%3.0f%%' % self.percent_complete
 
     def render_value(self):
+        if self.timed:
+            return '(%s of %s)' % (
+                pretty_time(self.value), pretty_time(self.max_value))
         if self.min_value == 0:
             return '(%g of %g)' % (self.value, self.max_value)
         else:
@@ -0,0 +1,373 @@
+from __future__ import division, print_function
+
+import heapq
+import json
+import os
+import socket
+import threading
+import time
+
+from .device import Device
+from .drawing import Drawing
+from .progress import Bar
+
+# where axi serve listens, and where clients look for it
+SOCKET_PATH = '~/.axi/serve.sock'
+
+# priority of jobs submitted without one. higher priorities run first and
+# equal priorities run in the order they were submitted
+DEFAULT_PRIORITY = 0
+
+# seconds a client waits for a job update before polling again
+POLL_INTERVAL = 0.5
+
+# device methods that can be queued as command jobs
+DEVICE_COMMANDS = (
+    'enable_motors', 'disable_motors', 'pen_up', 'pen_down',
+    'zero_position', 'home', 'move', 'goto', 'reset')
+
+# a job is a drawing or a device command waiting in, or taken from, the
+# server's queue. drawing jobs carry their plans once they have been made
+class Job(object):
+    def __init__(self, id, kind, args, priority, name):
+        self.id = id
+        self.kind = kind # 'draw' or 'command'
+        self.args = args # paths, or a command name and its arguments
+        self.priority = priority
+        self.name = name
+        self.status = 'queued' # running, done, cancelled or failed
+        self.error = None
+        self.cancelled = False
+        self.plans = None
+        self.planning = False
+        self.planned = threading.Event()
+        self.total = None # planned seconds of motion and pen moves
+        self.sent = 0 # seconds of those sent to the device
+        self.submit_time = time.time()
+        self.finished = threading.Event()
+
+    def info(self):
+        return dict(id=self.id, kind=self.kind, name=self.name,
+            priority=self.priority, status=self.status, error=self.error,
+            total=self.total, sent=self.sent)
+
+# a server owns one device for as long as it runs, so ports are scanned and
+# the servo configured once. clients connect to a unix socket and send one
+# json request per connection. jobs run one at a time on a worker thread,
+# while a planning thread plans the queued drawings, highest priority first.
+# without a device, one is opened once no other server is found running
+class Server(object):
+    def __init__(self, device=None, path=SOCKET_PATH):
+        self.device = device
+        self.path = os.path.expanduser(path)
+        self.queue = [] # heap of (-priority, id, job)
+        self.jobs = {}
+        self.current = None
+        self.next_id = 1
+        self.running = True
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.plan_lock = threading.Lock() # planners share the plan cache
+        self.sock = None
+
+    def submit(self, kind, args, priority=DEFAULT_PRIORITY, name=None):
+        if kind == 'command' and args[0] not in DEVICE_COMMANDS:
+            raise Exception('unknown command: %r' % args[0])
+        if kind not in ('draw', 'command'):
+            raise Exception('unknown job kind: %r' % kind)
+        with self.lock:
+            job = Job(self.next_id, kind, args, priority, name)
+            self.next_id += 1
+            self.jobs[job.id] = job
+            heapq.heappush(self.queue, (-priority, job.id, job))
+            self.changed.notify_all()
+        return job
+
+    def cancel(self, id):
+        # queued jobs are dropped, a running drawing stops after its current
+        # path and the pen returns home
+        with self.lock:
+            job = self.jobs.get(id)
+            if job is None:
+                raise Exception('unknown job: %r' % id)
+            if job.status in ('queued', 'running'):
+                job.cancelled = True
+            if job.status == 'queued':
+                self.finish(job, 'cancelled')
+            self.changed.notify_all()
+        return job
+
+    def finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.planned.set()
+        job.finished.set()
+
+    def waiting(self):
+        # queued jobs, in the order they will run
+        return [job for _, _, job in sorted(self.queue)
+            if job.status == 'queued']
+
+    def next_job(self):
+        with self.lock:
+            while self.running:
+                while self.queue:
+                    _, _, job = heapq.heappop(self.queue)
+                    if job.status == 'queued':
+                        job.status = 'running'
+                        self.current = job
+                        return job
+                self.changed.wait()
+        return None
+
+    def work_loop(self):
+        while True:
+            job = self.next_job()
+            if job is None:
+                break
+            print('job %d: %s' % (job.id, job.name or job.kind))
+            try:
+                if job.kind == 'draw':
+                    self.run_drawing(job)
+                else:
+                    self.run_command(job)
+            except Exception as e:
+                print('job %d failed: %s' % (job.id, e))
+                with self.lock:
+                    self.current = None
+                    self.finish(job, 'failed', str(e))
+                continue
+            with self.lock:
+                self.current = None
+                self.finish(job, 'cancelled' if job.cancelled else 'done')
+            print('job %d %s' % (job.id, job.status))
+
+    def plan_loop(self):
+        # plan queued drawings ahead of the worker
+        while True:
+            with self.lock:
+                job = None
+                while self.running and job is None:
+                    for queued in self.waiting():
+                        if queued.kind == 'draw' and not queued.planning:
+                            job = queued
+                            job.planning = True
+                            break
+                    else:
+                        self.changed.wait()
+                if job is None:
+                    return
+            try:
+                self.plan(job)
+            except Exception:
+                pass # the worker plans it again and reports the error
+
+    def plan(self, job):
+        device = self.device
+        try:
+            with self.plan_lock:
+                plans = device.plan_paths(Drawing(job.args).all_paths)
+            pen = (device.pen_up_duration() +
+                device.pen_down_duration()) / 1000
+            job.total = sum(plan.t for plan in plans) + pen * len(job.args)
+            job.plans = plans
+        finally:
+            job.planned.set()
+
+    def run_drawing(self, job):
+        with self.lock:
+            planning = job.planning
+            job.planning = True
+        if planning:
+            job.planned.wait()
+        if job.plans is None:
+            self.plan(job)
+        device = self.device
+        pen = (device.pen_up_duration() + device.pen_down_duration()) / 1000
+        device.enable_motors()
+        device.pen_up()
+        error = device.error
+        for i, plan in enumerate(job.plans):
+            if job.cancelled:
+                device.home()
+                break
+            moves, error = device.compile_moves(plan, error)
+            device.run_compiled_path(i, moves, error)
+            job.sent += plan.t + (pen if i % 2 else 0)
+        device.flush()
+        device.disable_motors()
+        job.plans = None
+
+    def run_command(self, job):
+        name, args = job.args[0], job.args[1:]
+        if name == 'reset':
+            self.device.disable_motors()
+            self.device.pen_up()
+        else:
+            getattr(self.device, name)(*args)
+        self.device.flush()
+
+    def handle(self, conn):
+        fp = conn.makefile('rwb')
+        try:
+            line = fp.readline()
+            if not line:
+                return
+            try:
+                result = self.request(json.loads(line.decode('utf-8')))
+            except Exception as e:
+                result = dict(error=str(e))
+            fp.write((json.dumps(result) + '\n').encode('utf-8'))
+            fp.flush()
+        finally:
+            fp.close()
+            conn.close()
+
+    def request(self, request):
+        op = request.get('op')
+        if op == 'submit':
+            job = self.submit(request['kind'], request['args'],
+                request.get('priority', DEFAULT_PRIORITY),
+                request.get('name'))
+            return dict(job=job.info())
+        if op == 'cancel':
+            return dict(job=self.cancel(request['id']).info())
+        if op == 'status':
+            job = self.jobs.get(request['id'])
+            if job is None:
+                raise Exception('unknown job: %r' % request['id'])
+            job.finished.wait(request.get('wait', 0))
+            return dict(job=job.info())
+        if op == 'jobs':
+            with self.lock:
+                jobs = self.waiting()
+                if self.current is not None:
+                    jobs.insert(0, self.current)
+            return dict(jobs=[job.info() for job in jobs])
+        raise Exception('unknown request: %r' % op)
+
+    def serve_forever(self):
+        if server_running(self.path):
+            raise Exception('axi server already running at %s' % self.path)
+        if self.device is None:
+            self.device = Device()
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        if os.path.exists(self.path):
+            os.remove(self.path) # left behind by a server that died
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(16)
+        threads = [
+            threading.Thread(target=self.work_loop),
+            threading.Thread(target=self.plan_loop),
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        print('listening on %s' % self.path)
+        try:
+            while True:
+                conn, _ = self.sock.accept()
+                if not self.running:
+                    conn.close()
+                    break
+                thread = threading.Thread(target=self.handle, args=(conn,))
+                thread.daemon = True
+                thread.start()
+        finally:
+            self.shutdown()
+            self.sock.close()
+            os.remove(self.path)
+            for thread in threads:
+                thread.join()
+            self.device.close()
+
+    def shutdown(self):
+        # stop accepting jobs. a running drawing is cancelled, so it stops
+        # after its current path and the pen returns home
+        with self.lock:
+            self.running = False
+            if self.current is not None:
+                self.current.cancelled = True
+            self.changed.notify_all()
+        # wake up accept with a connection of our own
+        server_running(self.path)
+
+def server_running(path=SOCKET_PATH):
+    path = os.path.expanduser(path)
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+        return False
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+    return True
+
+# a client sends requests to a running server
+class Client(object):
+    def __init__(self, path=SOCKET_PATH):
+        self.path = os.path.expanduser(path)
+
+    def request(self, **kwargs):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        fp = sock.makefile('rwb')
+        try:
+            fp.write((json.dumps(kwargs) + '\n').encode('utf-8'))
+            fp.flush()
+            result = json.loads(fp.readline().decode('utf-8'))
+        finally:
+            fp.close()
+            sock.close()
+        if 'error' in result:
+            raise Exception(result['error'])
+        return result
+
+    def submit(self, drawing, priority=DEFAULT_PRIORITY, name=None):
+        paths = [[tuple(p) for p in path] for path in drawing.paths]
+        return self.request(op='submit', kind='draw', args=paths,
+            priority=priority, name=name)['job']
+
+    def command(self, name, *args):
+        # queue a device command behind the jobs before it and wait for it
+        job = self.request(op='submit', kind='command',
+            args=[name] + list(args), name=name)['job']
+        return self.wait(job['id'], False)
+
+    def cancel(self, id):
+        return self.request(op='cancel', id=id)['job']
+
+    def status(self, id, wait=0):
+        return self.request(op='status', id=id, wait=wait)['job']
+
+    def jobs(self):
+        return self.request(op='jobs')['jobs']
+
+    def wait(self, id, progress=True):
+        # block until a job has finished, showing its progress in seconds of
+        # planned motion once it has been planned
+        bar = Bar(0, enabled=progress, timed=True)
+        queued = True
+        while True:
+            job = self.status(id, POLL_INTERVAL)
+            if queued and job['status'] != 'queued':
+                bar.start_time = time.time() # time spent queued isn't shown
+                queued = False
+            if job['total'] is not None:
+                bar.max_value = job['total']
+                bar.update(job['sent'])
+            if job['status'] not in ('queued', 'running'):
+                break
+        if progress and job['total'] is not None:
+            if job['status'] == 'done':
+                bar.done()
+            else:
+                bar.stop()
+        if job['status'] == 'failed':
+            raise Exception('job %d failed: %s' % (id, job['error']))
+        return job
@@ -0,0 +1,272 @@
+from __future__ import division, print_function
+
+import math
+import threading
+import time
+
+from bisect import bisect_right
+from collections import deque
+
+# round trip time of the usb link, in seconds
+LATENCY = 0.002
+
+# time the firmware spends parsing and queueing one command, in seconds
+COMMAND_TIME = 0.0005
+
+# number of motion commands that can wait behind the one being executed
+FIFO_SIZE = 1
+
+# simulated seconds per real second, or zero to run on a virtual clock that
+# only advances while the host waits for a response
+SPEED = 0
+
+# firmware version reported by V. LM is only understood from 2.7.0 on
+FIRMWARE = (2, 7, 0)
+LM_FIRMWARE = (2, 7, 0)
+
+LM_TICK_HZ = 25000
+LM_SCALE = 2 ** 31
+
+# a simulated EiBotBoard that can stand in for a serial.Serial, so that the
+# send path can be run and timed without a plotter:
+#
+#     device = axi.Device(serial=Simulator())
+#
+# commands arrive after half the round trip and are parsed one at a time.
+# motion commands (XM, LM, SM, SP) wait for room in the motion fifo before
+# being acknowledged and then run back to back. the step position is exact
+# at any instant, and every gap between two motion commands, where the host
+# failed to keep the fifo full, is counted as an underrun
+class Simulator(object):
+    def __init__(self, latency=LATENCY, command_time=COMMAND_TIME,
+            fifo_size=FIFO_SIZE, speed=SPEED, timeout=1, firmware=FIRMWARE):
+        self.latency = latency
+        self.command_time = command_time
+        self.fifo_size = fifo_size
+        self.speed = speed
+        self.timeout = timeout
+        self.firmware = tuple(firmware)
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.buffer = b''
+        self.responses = deque() # (time, line)
+        self.start = time.time()
+        self.time = 0 # host clock when running on virtual time
+        self.parser_time = 0 # when the parser is free for the next command
+        self.pen = 1
+        self.offset = (0, 0) # step position cleared by CS
+        self.starts = [] # motion commands, in order
+        self.ends = []
+        self.moves = []
+        self.totals = [(0, 0)] # step position before each motion command
+        self.commands = 0
+        self.underruns = 0
+        self.idle_time = 0
+        self.stalls = 0
+
+    # serial.Serial interface
+    def write(self, data):
+        with self.lock:
+            self.buffer += data
+            while b'\r' in self.buffer:
+                line, self.buffer = self.buffer.split(b'\r', 1)
+                line = line.decode('utf-8').strip()
+                if line:
+                    self.receive(line)
+            self.ready.notify_all()
+        return len(data)
+
+    def readline(self):
+        with self.lock:
+            deadline = time.time() + self.timeout
+            while True:
+                delay = None
+                if self.responses:
+                    t, line = self.responses[0]
+                    if not self.speed:
+                        self.time = max(self.time, t)
+                        break
+                    delay = (t - self.now()) / self.speed
+                    if delay <= 0:
+                        break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return b''
+                if delay is not None:
+                    remaining = min(remaining, delay)
+                self.ready.wait(remaining)
+            self.responses.popleft()
+            return (line + '\r\n').encode('utf-8')
+
+    def close(self):
+        pass
+
+    # simulated firmware
+    def now(self):
+        if self.speed:
+            return (time.time() - self.start) * self.speed
+        return self.time
+
+    def receive(self, line):
+        self.commands += 1
+        t = max(self.now() + self.latency / 2, self.parser_time)
+        t += self.command_time
+        args = line.split(',')
+        name = args[0].upper()
+        try:
+            values = [int(x) for x in args[1:]]
+            lines = self.execute(name, values, t)
+        except (ValueError, IndexError):
+            lines = ['!8 Err: %s' % line]
+        t = self.parser_time
+        for line in lines:
+            self.responses.append((t + self.latency / 2, line))
+
+    def execute(self, name, args, t):
+        # runs one command that was parsed at time t and returns its response
+        self.parser_time = t
+        if name in ('SC', 'EM'):
+            return ['OK']
+        if name == 'V':
+            return ['EBBv13_and_above EB Firmware Version %d.%d.%d' %
+                self.firmware]
+        if name == 'CS':
+            self.offset = self.position(t, raw=True)
+            return ['OK']
+        if name == 'QS':
+            return ['%d,%d' % self.position(t), 'OK']
+        if name == 'QM':
+            return ['QM,%d,%d,%d,%d' % self.motor_status(t)]
+        if name == 'QP':
+            return [str(self.pen), 'OK']
+        if name == 'SP':
+            self.pen = args[0]
+            delay = args[1] if len(args) > 1 else 0
+            self.queue(('SP', delay / 1000, 0, 0), t)
+            return ['OK']
+        if name == 'XM':
+            duration, a, b = args
+            self.queue(('XM', duration / 1000, a + b, a - b), t)
+            return ['OK']
+        if name == 'SM':
+            duration, m1, m2 = args
+            self.queue(('SM', duration / 1000, m1, m2), t)
+            return ['OK']
+        if name == 'LM' and self.firmware >= LM_FIRMWARE:
+            rate1, steps1, accel1, rate2, steps2, accel2 = args
+            ticks1, done1 = lm_ticks(rate1, abs(steps1), accel1)
+            ticks2, done2 = lm_ticks(rate2, abs(steps2), accel2)
+            if done1 < abs(steps1) or done2 < abs(steps2):
+                self.stalls += 1
+            m1 = int(math.copysign(done1, steps1))
+            m2 = int(math.copysign(done2, steps2))
+            duration = max(ticks1, ticks2) / LM_TICK_HZ
+            self.queue(('LM', duration, m1, m2, rate1, accel1,
+                rate2, accel2), t)
+            return ['OK']
+        return ['!8 Err: Unknown command']
+
+    def queue(self, move, t):
+        # the command is accepted once there is room in the fifo
+        if len(self.starts) >= self.fifo_size:
+            t = max(t, self.starts[-self.fifo_size])
+        self.parser_time = t
+        start = t
+        if self.ends:
+            end = self.ends[-1]
+            if end > t:
+                start = end
+            elif end < t:
+                self.underruns += 1
+                self.idle_time += t - end
+        a, b = self.totals[-1]
+        self.starts.append(start)
+        self.ends.append(start + move[1])
+        self.moves.append(move)
+        self.totals.append((a + move[2], b + move[3]))
+
+    def position(self, t, raw=False):
+        # motor step position at time t
+        i = bisect_right(self.starts, t) - 1
+        if i < 0:
+            a, b = self.totals[0]
+        else:
+            a, b = self.totals[i]
+            if t >= self.ends[i]:
+                a, b = self.totals[i + 1]
+            else:
+                da, db = move_steps(self.moves[i], t - self.starts[i])
+                a += da
+                b += db
+        if not raw:
+            a -= self.offset[0]
+            b -= self.offset[1]
+        return a, b
+
+    def motor_status(self, t):
+        i = bisect_right(self.starts, t) - 1
+        executing = i >= 0 and t < self.ends[i]
+        queued = i + 1 < len(self.starts)
+        move = self.moves[i] if executing else ('', 0, 0, 0)
+        return (int(executing or queued), int(move[2] != 0),
+            int(move[3] != 0), int(queued))
+
+    @property
+    def motion_time(self):
+        return sum(end - start for start, end in zip(self.starts, self.ends))
+
+    @property
+    def finish_time(self):
+        return self.ends[-1] if self.ends else 0
+
+    def print_stats(self):
+        print('commands        : %d' % self.commands)
+        print('motion commands : %d' % len(self.moves))
+        print('motion time     : %.3f s' % self.motion_time)
+        print('finish time     : %.3f s' % self.finish_time)
+        print('underruns       : %d (%.3f s idle)' % (
+            self.underruns, self.idle_time))
+        if self.stalls:
+            print('stalled moves   : %d' % self.stalls)
+
+def move_steps(move, t):
+    # steps taken by each motor t seconds into a motion command
+    kind, duration, m1, m2 = move[:4]
+    if t >= duration:
+        return m1, m2
+    if kind == 'LM':
+        ticks = int(t * LM_TICK_HZ)
+        rate1, accel1, rate2, accel2 = move[4:]
+        s1 = min(abs(m1), lm_steps(rate1, accel1, ticks))
+        s2 = min(abs(m2), lm_steps(rate2, accel2, ticks))
+        return int(math.copysign(s1, m1)), int(math.copysign(s2, m2))
+    f = t / duration
+    return int(m1 * f), int(m2 * f)
+
+def lm_steps(rate, accel, ticks):
+    # the step accumulator gains rate + accel * k on tick k
+    return (rate * ticks + accel * ticks * (ticks + 1) // 2) // LM_SCALE
+
+def lm_ticks(rate, steps, accel):
+    # ticks needed to take the steps, and the steps actually taken, which
+    # fall short if the rate decays to zero first
+    if steps == 0:
+        return 0, 0
+    target = steps * LM_SCALE
+    a = accel / 2
+    b = rate + accel / 2
+    if a < 0:
+        peak = max(0, int(-b / (2 * a)))
+        if rate * peak + accel * peak * (peak + 1) // 2 < target:
+            return peak, lm_steps(rate, accel, peak)
+    if a == 0:
+        if b <= 0:
+            return 0, 0
+        ticks = int(target / b)
+    else:
+        d = max(0, b * b + 4 * a * target)
+        ticks = int((-b + math.sqrt(d)) / (2 * a))
+    ticks = max(ticks - 2, 0)
+    while lm_steps(rate, accel, ticks) < steps:
+        ticks += 1
+    return ticks, steps
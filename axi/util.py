@@ -1,12 +1,22 @@
 from .device import Device
+from .server import Client, server_running
 
 def reset():
+    if server_running():
+        Client().command('reset')
+        return
     d = Device()
     d.disable_motors()
     d.pen_up()
 
 def draw(drawing, progress=True):
     # TODO: support drawing, list of paths, or single path
+    if server_running():
+        # queue it on axi serve, which owns the device
+        client = Client()
+        job = client.submit(drawing)
+        client.wait(job['id'], progress)
+        return
     d = Device()
     d.enable_motors()
     d.run_drawing(drawing, progress)
@@ -0,0 +1,67 @@
+from __future__ import division, print_function
+
+from axi import Device, Drawing, Farm
+from axi.simulator import Simulator
+
+import random
+
+def random_drawing(count, n, size):
+    paths = []
+    for _ in range(count):
+        path = [(random.uniform(0, size), random.uniform(0, size))
+            for _ in range(n)]
+        paths.append(path)
+    return Drawing(paths)
+
+# a simulator whose port stops answering after a number of commands
+class FailingSimulator(Simulator):
+    def __init__(self, commands):
+        super(FailingSimulator, self).__init__()
+        self.remaining = commands
+
+    def write(self, data):
+        self.remaining -= 1
+        if self.remaining < 0:
+            raise IOError('device disconnected')
+        return super(FailingSimulator, self).write(data)
+
+def round_robin_makespan(estimates, n):
+    # what dealing out the drawings by count would take
+    totals = [0] * n
+    for i, t in enumerate(estimates):
+        totals[i % n] += t
+    return max(totals)
+
+def run(drawings, serials):
+    devices = [Device(serial=serial) for serial in serials]
+    results = Farm(devices).run(drawings)
+    for device in devices:
+        device.close()
+    print('simulated finish times: %s' % ', '.join(
+        '%.1fs' % s.finish_time for s in serials))
+    for result in results:
+        if result.status != 'done' or result.attempts > 1:
+            print('drawing %d: %s after %d attempts (%s)' % (
+                result.index, result.status, result.attempts, result.error))
+
+def main():
+    random.seed(0)
+    drawings = [random_drawing(random.randint(2, 40), 4, 4)
+        for _ in range(12)]
+    n = 3
+    device = Device(connect=False)
+    estimates = [device.estimate_time(d).total for d in drawings]
+    print('%d drawings, %.1fs estimated, %d plotters' % (
+        len(drawings), sum(estimates), n))
+    print('round robin by count would take %.1fs' % round_robin_makespan(
+        estimates, n))
+    run(drawings, [Simulator() for _ in range(n)])
+    print('with one plotter failing part way:')
+    run(drawings, [Simulator() for _ in range(n - 1)] +
+        [FailingSimulator(2000)])
+    print('with a plotter failing after the others have run out of work:')
+    run([random_drawing(200, 4, 4), random_drawing(2, 4, 4)],
+        [FailingSimulator(3000), Simulator()])
+
+if __name__ == '__main__':
+    main()
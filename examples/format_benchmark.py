@@ -0,0 +1,49 @@
+from __future__ import division, print_function
+
+from axi import Drawing, PathSet
+
+import os
+import random
+import tempfile
+import time
+
+def random_pathset(count, n, size):
+    random.seed(0)
+    paths = []
+    for _ in range(count):
+        x = random.uniform(0, size)
+        y = random.uniform(0, size)
+        path = [(x + random.random(), y + random.random()) for _ in range(n)]
+        paths.append(path)
+    return PathSet.from_paths(paths)
+
+def timed(name, filename, func):
+    start = time.time()
+    result = func(filename)
+    elapsed = time.time() - start
+    size = os.path.getsize(filename)
+    print('%-16s: %7.1f MB in %6.3fs, %7.1f MB/s' % (
+        name, size / 1e6, elapsed, size / 1e6 / max(elapsed, 1e-6)))
+    return result
+
+def main():
+    drawing = Drawing(random_pathset(250000, 8, 10))
+    print('%d paths, %d points' % (len(drawing.paths), drawing.paths.n))
+    directory = tempfile.mkdtemp()
+    text = os.path.join(directory, 'drawing.axi')
+    f8 = os.path.join(directory, 'drawing.axb')
+    f4 = os.path.join(directory, 'drawing32.axb')
+    timed('dump text', text, drawing.dump)
+    timed('dump binary f8', f8, drawing.dump)
+    timed('dump binary f4', f4, lambda x: drawing.dump_binary(x, 'f4'))
+    a = timed('load text', text, Drawing.load)
+    b = timed('load binary f8', f8, Drawing.load)
+    timed('load binary f4', f4, Drawing.load)
+    print('same bounds: %s' % all(
+        abs(p - q) < 1e-6 for p, q in zip(a.bounds, b.bounds)))
+    for filename in (text, f8, f4):
+        os.remove(filename)
+    os.rmdir(directory)
+
+if __name__ == '__main__':
+    main()
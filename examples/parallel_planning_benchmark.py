@@ -0,0 +1,42 @@
+from __future__ import division, print_function
+
+from axi import Planner
+from multiprocessing import cpu_count
+
+import random
+import time
+
+def random_walk(n, step):
+    x = y = 0
+    points = []
+    for i in range(n):
+        x += random.uniform(-step, step)
+        y += random.uniform(-step, step)
+        points.append((x, y))
+    return points
+
+def main():
+    random.seed(0)
+    paths = [random_walk(random.randint(2, 200), 0.05) for _ in range(5000)]
+    n = sum(len(path) for path in paths)
+    print('%d paths, %d points, %d cpus' % (len(paths), n, cpu_count()))
+    counts = [1]
+    while counts[-1] * 2 <= cpu_count():
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpu_count():
+        counts.append(cpu_count())
+    for engine in ['python', 'numpy']:
+        planner = Planner(16, 4, 0.001, engine=engine)
+        baseline = None
+        for processes in counts:
+            start = time.time()
+            planner.plan_all(paths, processes)
+            elapsed = time.time() - start
+            baseline = baseline or elapsed
+            speedup = baseline / elapsed
+            print('%-6s engine, %2d processes: %.2fs (%.2fx, %.0f%% '
+                'efficiency)' % (engine, processes, elapsed, speedup,
+                100 * speedup / processes))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+from __future__ import division, print_function
+
+from axi.parser import (
+    load_axi, load_semicolon, parse_axi_lines, parse_semicolon_lines)
+
+import os
+import random
+import tempfile
+import time
+
+def write_files(directory, count, n):
+    random.seed(0)
+    text = os.path.join(directory, 'drawing.axi')
+    semicolon = os.path.join(directory, 'drawing.txt')
+    with open(text, 'w') as a, open(semicolon, 'w') as b:
+        for _ in range(count):
+            path = ['%f,%f' % (random.uniform(0, 10), random.uniform(0, 10))
+                for _ in range(n)]
+            a.write(' '.join(path) + '\n')
+            b.write(';'.join(path) + '\n')
+    return text, semicolon
+
+def read_all(parse_lines):
+    # the line by line loader, reading the whole file first as before
+    def load(filename):
+        with open(filename, 'rb') as fp:
+            return parse_lines(fp.read())
+    return load
+
+def timed(name, filename, load):
+    start = time.time()
+    load(filename)
+    elapsed = time.time() - start
+    size = os.path.getsize(filename) / 1e6
+    print('%-22s: %.2fs, %6.1f MB/s' % (name, elapsed, size / elapsed))
+    return elapsed
+
+def main():
+    directory = tempfile.mkdtemp()
+    text, semicolon = write_files(directory, 250000, 8)
+    print('%.1f MB of text, 2000000 points' % (os.path.getsize(text) / 1e6))
+    for name, filename, old, new in [
+            ('.axi', text, read_all(parse_axi_lines), load_axi),
+            ('load_paths', semicolon, read_all(parse_semicolon_lines),
+                load_semicolon)]:
+        a = timed(name + ' line by line', filename, old)
+        b = timed(name + ' streaming', filename, new)
+        print('%-22s: %.1fx' % (name + ' speedup', a / b))
+    os.remove(text)
+    os.remove(semicolon)
+    os.rmdir(directory)
+
+if __name__ == '__main__':
+    main()
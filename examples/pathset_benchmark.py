@@ -0,0 +1,45 @@
+from __future__ import division, print_function
+
+from axi import Drawing
+from axi.pathset import PathSet
+
+import random
+import time
+import tracemalloc
+
+def stipple(count, size):
+    # short dashes, like a stipple drawing
+    random.seed(0)
+    paths = []
+    for _ in range(count):
+        x = random.uniform(0, size)
+        y = random.uniform(0, size)
+        paths.append([(x, y), (x + 0.01, y), (x + 0.01, y + 0.01),
+            (x, y + 0.01)])
+    return paths
+
+def measure(name, build):
+    tracemalloc.start()
+    start = time.time()
+    drawing = build()
+    elapsed = time.time() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.time()
+    drawing.bounds, drawing.length, drawing.down_length
+    aggregates = time.time() - start
+    print('%-8s: %7.1f MB, built in %.2fs, bounds and lengths in %.3fs' % (
+        name, size / 1e6, elapsed, aggregates))
+    return drawing
+
+def main():
+    n = 500000
+    print('%d paths, %d points' % (n, n * 4))
+    a = measure('lists', lambda: Drawing(stipple(n, 10)))
+    b = measure('pathset', lambda: Drawing(PathSet.from_paths(
+        stipple(n, 10))))
+    print('same bounds and length: %s' % (
+        a.bounds == b.bounds and abs(a.length - b.length) < 1e-6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+from __future__ import division, print_function
+
+from axi import Planner, planner
+from axi.planner import Throttler
+from axi.planner import backtracking_velocities, linear_velocities
+from math import pi, sin, cos
+
+import numpy as np
+import random
+import time
+
+def spiral(cx, cy, r, turns, n):
+    points = []
+    for i in range(n):
+        t = i / (n - 1)
+        a = 2 * pi * turns * t
+        points.append((cx + cos(a) * r * t, cy + sin(a) * r * t))
+    return points
+
+def random_walk(n, step):
+    x = y = 0
+    points = []
+    for i in range(n):
+        x += random.uniform(-step, step)
+        y += random.uniform(-step, step)
+        points.append((x, y))
+    return points
+
+def benchmark(func, paths, repeat=3):
+    # best of several runs
+    result = None
+    for _ in range(repeat):
+        start = time.time()
+        for path in paths:
+            func(path)
+        elapsed = time.time() - start
+        result = elapsed if result is None else min(result, elapsed)
+    return result
+
+def throttle(path):
+    Throttler(path, 4, 0.02, 0.001).compute_max_velocities()
+
+def throttle_by_length(total=20000):
+    # the same number of points split into paths of each length, throttled
+    # one vertex at a time and with the numpy sweep
+    limit = planner.THROTTLE_SWEEP_POINTS
+    for n in [3, 10, 30, 100, 1000]:
+        paths = [random_walk(n, 0.1) for _ in range(total // n)]
+        times = []
+        for points in [total + 1, 0]:
+            planner.THROTTLE_SWEEP_POINTS = points
+            times.append(benchmark(throttle, paths, 1))
+        planner.THROTTLE_SWEEP_POINTS = limit
+        print('throttler, %4d point paths: scalar %.3fs, sweep %.3fs' % (
+            n, times[0], times[1]))
+
+def velocity_passes(n):
+    # long runs of short segments, each followed by a sharp corner
+    lengths = np.full(n, 1e-4)
+    max_entry = np.full(n + 1, 4.0)
+    max_entry[::n // 20] = 0
+    max_entry[-1] = 0
+    start = time.time()
+    backtracking_velocities(lengths.tolist(), max_entry.tolist(), 16)
+    backtrack = time.time() - start
+    start = time.time()
+    linear_velocities(lengths, max_entry, 16)
+    linear = time.time() - start
+    print('velocity passes, %d segments: backtrack %.3fs, linear %.3fs' % (
+        n, backtrack, linear))
+
+def engines_by_length(python, numpy, total=20000):
+    # the same number of points split into paths of each length. a single
+    # total over mixed paths is dominated by the longest ones
+    for n in [3, 10, 30, 100, 1000, 10000]:
+        paths = [random_walk(n, 0.1) for _ in range(total // n)]
+        baseline = benchmark(python.plan, paths)
+        elapsed = benchmark(numpy.plan, paths)
+        print('%5d point paths     : python %.3fs, numpy %.3fs (%.1fx)' % (
+            n, baseline, elapsed, baseline / elapsed))
+
+def main():
+    random.seed(0)
+    paths = [spiral(4, 4, 3, 20, 10000), random_walk(10000, 0.1)]
+    paths += [random_walk(20, 0.5) for _ in range(500)]
+    n = sum(len(path) for path in paths)
+    print('%d paths, %d points' % (len(paths), n))
+    python = Planner(16, 4, 0.001)
+    numpy = Planner(16, 4, 0.001, engine='numpy')
+    # both engines share the throttler, so report it separately
+    shared = benchmark(throttle, paths)
+    baseline = benchmark(python.plan, paths)
+    print('throttler (shared)  : %.3fs' % shared)
+    print('python engine       : %.3fs' % baseline)
+    for name, func in [('numpy engine', numpy.plan),
+            ('numpy plan_arrays', numpy.plan_arrays)]:
+        elapsed = benchmark(func, paths)
+        print('%-20s: %.3fs (%.1fx)' % (name, elapsed, baseline / elapsed))
+    engines_by_length(python, numpy)
+    throttle_by_length()
+    for n in [10000, 100000, 1000000]:
+        velocity_passes(n)
+
+if __name__ == '__main__':
+    main()
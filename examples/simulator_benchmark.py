@@ -0,0 +1,42 @@
+from __future__ import division, print_function
+
+from axi import Device, Drawing
+from axi.simulator import Simulator
+
+import random
+import time
+
+def random_paths(count, n, size):
+    paths = []
+    for _ in range(count):
+        path = [(random.uniform(0, size), random.uniform(0, size))
+            for _ in range(n)]
+        paths.append(path)
+    return paths
+
+def run(compiled, move_command, window, latency):
+    # sends precompiled moves so that only the send path is timed
+    sim = Simulator(latency=latency)
+    device = Device(serial=sim, move_command=move_command,
+        pipeline_window=window)
+    start = time.time()
+    device.run_compiled(compiled)
+    elapsed = time.time() - start
+    device.close()
+    print('%s window %2d, %4.1f ms rtt: %6d commands in %.2fs wall, '
+        'finish %.1fs for %.1fs of motion, %d underruns (%.1fs idle)' % (
+        move_command, window, latency * 1000, sim.commands, elapsed,
+        sim.finish_time, sim.motion_time, sim.underruns, sim.idle_time))
+
+def main():
+    random.seed(0)
+    drawing = Drawing(random_paths(50, 5, 8))
+    for move_command in ['XM', 'LM']:
+        device = Device(serial=Simulator(), move_command=move_command)
+        compiled = device.compile_drawing(drawing)
+        for latency in [0.001, 0.004, 0.016]:
+            for window in [0, 2, 8]:
+                run(compiled, move_command, window, latency)
+
+if __name__ == '__main__':
+    main()
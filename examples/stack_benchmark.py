@@ -0,0 +1,40 @@
+from __future__ import division, print_function
+
+from axi import Drawing
+
+import random
+import time
+
+def random_drawing(count, size):
+    paths = []
+    for _ in range(count):
+        path = [(random.uniform(0, size), random.uniform(0, size))
+            for _ in range(4)]
+        paths.append(path)
+    return Drawing(paths)
+
+def vertical_stack(drawings, spacing=0):
+    result = Drawing()
+    y = 0
+    for d in drawings:
+        result.add(d.origin().translate(0, y))
+        y += d.height + spacing
+    return result
+
+def main():
+    random.seed(0)
+    for n in [500, 1000, 2000, 4000, 8000]:
+        drawings = [random_drawing(5, 3) for _ in range(n)]
+        start = time.time()
+        d = Drawing()
+        for x in drawings:
+            # reads the height after every add, like layout code does
+            d.add(x.translate(0, d.height))
+        elapsed = time.time() - start
+        start = time.time()
+        vertical_stack(drawings, 0.1)
+        print('%5d drawings: add and height %.3fs, vertical_stack %.3fs' % (
+            n, elapsed, time.time() - start))
+
+if __name__ == '__main__':
+    main()